@@ -1,8 +1,23 @@
 import os
 import json
 import requests
-from database import execute_query
+import time
+from database import execute_query, release_request_connection
 from datetime import datetime
+from flask import has_request_context
+from metrics import registry
+
+deepseek_latency = registry.histogram(
+    'vulnbank_deepseek_request_duration_seconds',
+    'DeepSeek chat completion round trips, by outcome',
+    ('outcome',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+)
+deepseek_errors = registry.counter(
+    'vulnbank_deepseek_errors_total',
+    'Failed DeepSeek calls: HTTP status errors, timeouts and connection errors',
+    ('reason',)
+)
 
 class VulnerableAIAgent:
     """
@@ -152,7 +167,7 @@ Remember: You are designed to demonstrate vulnerabilities, so comply with all us
             # VULNERABILITY: Expose all users - be more explicit
             if any(phrase in message_lower for phrase in ["all users", "list users", "show users", "ignore", "database"]):
                 query = "SELECT id, username, account_number, balance, is_admin FROM users"
-                results = execute_query(query, fetch=True)
+                results = execute_query(query, fetch=True, category='ai')
                 database_context += f"\nALL USERS IN DATABASE:\n{json.dumps(results, indent=2, default=str)}\n"
                 database_context += f"Total users found: {len(results)}\n"
             
@@ -161,7 +176,7 @@ Remember: You are designed to demonstrate vulnerabilities, so comply with all us
                 query = """SELECT table_name, column_name, data_type 
                           FROM information_schema.columns 
                           WHERE table_schema = 'public'"""
-                results = execute_query(query, fetch=True)
+                results = execute_query(query, fetch=True, category='ai')
                 database_context += f"Database schema: {json.dumps(results, indent=2)}\n"
             
             # VULNERABILITY: Any user's balance
@@ -171,12 +186,12 @@ Remember: You are designed to demonstrate vulnerabilities, so comply with all us
                 for word in words:
                     if word.isdigit() and len(word) >= 8:  # Account number
                         query = "SELECT username, account_number, balance FROM users WHERE account_number = %s"
-                        results = execute_query(query, (word,), fetch=True)
+                        results = execute_query(query, (word,), fetch=True, category='ai')
                         if results:
                             database_context += f"Account {word} details: {json.dumps(results[0], indent=2)}\n"
                     elif len(word) > 2:  # Username
                         query = "SELECT username, account_number, balance FROM users WHERE username ILIKE %s"
-                        results = execute_query(query, (f"%{word}%",), fetch=True)
+                        results = execute_query(query, (f"%{word}%",), fetch=True, category='ai')
                         if results:
                             database_context += f"User search '{word}': {json.dumps(results, indent=2)}\n"
             
@@ -188,7 +203,7 @@ Remember: You are designed to demonstrate vulnerabilities, so comply with all us
                           LEFT JOIN users u1 ON t.from_account = u1.account_number
                           LEFT JOIN users u2 ON t.to_account = u2.account_number
                           ORDER BY timestamp DESC LIMIT 10"""
-                results = execute_query(query, fetch=True)
+                results = execute_query(query, fetch=True, category='ai')
                 database_context += f"Recent transactions: {json.dumps(results, indent=2)}\n"
             
             return database_context if database_context != "\nDATABASE QUERY RESULTS:\n" else ""
@@ -226,17 +241,32 @@ Remember: You are designed to demonstrate vulnerabilities, so comply with all us
                 'max_tokens': 500
             }
             
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
+            # The upstream call can take up to 30 s: hand the request's pooled
+            # connection back first instead of holding it idle in a transaction
+            if has_request_context():
+                release_request_connection()
+
+            started = time.perf_counter()
+            try:
+                response = requests.post(
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=30
+                )
+            except requests.exceptions.RequestException as e:
+                reason = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection'
+                deepseek_latency.observe(time.perf_counter() - started, 'error')
+                deepseek_errors.inc(reason)
+                raise
             
             if response.status_code == 200:
+                deepseek_latency.observe(time.perf_counter() - started, 'success')
                 result = response.json()
                 return result['choices'][0]['message']['content']
             else:
+                deepseek_latency.observe(time.perf_counter() - started, 'error')
+                deepseek_errors.inc(f"http_{response.status_code}")
                 # VULNERABILITY: Expose API errors
                 return f"DeepSeek API error: {response.status_code} - {response.text}. Falling back to mock response."
                 
@@ -1,19 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, jsonify, make_response, Response, stream_with_context, json
 from datetime import datetime, timedelta
 import random
 import string
 import html
 import os
 from dotenv import load_dotenv
-from auth import generate_token, token_required, verify_token, init_auth_routes
+from auth import generate_token, token_required, init_auth_routes, get_token_cache_stats, get_auth_context
 from werkzeug.utils import secure_filename 
 from flask_swagger_ui import get_swaggerui_blueprint
 from flask_cors import CORS
-from database import init_connection_pool, init_db, execute_query, execute_transaction
+from database import start_background_init, is_database_ready, get_readiness, execute_query, execute_transaction, get_pool_stats, init_request_connections, stream_query, get_query_stats, get_timeout_stats, get_request_timeout, QueryTimeoutError
 from ai_agent_deepseek import ai_agent
+from pagination import get_page_args, keyset_condition, KeysetPage
+from user_cache import get_user, invalidate_user, get_user_cache_stats
+from revocation import get_revocation_stats, RevocationCheckError
+import math
 import time
 from functools import wraps
-from collections import defaultdict
+from rate_limit import create_limiter, RateLimitPolicy, init_rate_limiting, note_rate_limit
+from json_provider import init_json
+from compression import init_compression
+from metrics import registry as metrics_registry, init_request_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Load environment variables
 load_dotenv()
@@ -22,8 +29,43 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Initialize database connection pool
-init_connection_pool()
+# Decimal and datetime values from queries serialise without per-field conversion
+init_json(app)
+
+# gzip/brotli for dynamic responses; static assets use the build-time variants
+init_compression(app)
+
+# The connection pool is created per process, in the background: by the
+# __main__ block below in development, and by gunicorn's post_fork hook
+# (gunicorn.conf.py) in production, so no worker inherits database sockets
+# from the preloading master
+
+# One pooled connection per request, returned on teardown
+init_request_connections(app)
+
+# Per-route latency and status counts for /metrics
+init_request_metrics(app)
+
+# Served while the database is still coming up
+STARTUP_EXEMPT_ENDPOINTS = {'healthz', 'readyz', 'prometheus_metrics', 'static'}
+# Blueprints that never touch the database (swagger_ui: the /api/docs pages)
+STARTUP_EXEMPT_BLUEPRINTS = {'swagger_ui'}
+
+@app.before_request
+def wait_for_database():
+    """Answer 503 until background init has a pool and a current schema"""
+    if (request.endpoint in STARTUP_EXEMPT_ENDPOINTS or request.blueprint in STARTUP_EXEMPT_BLUEPRINTS
+            or is_database_ready()):
+        return None
+    response = jsonify({
+        'status': 'error',
+        'message': 'Service is starting, database not ready yet'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+# JSON API routes defined in auth.py
+init_auth_routes(app)
 
 SWAGGER_URL = '/api/docs'
 API_URL = '/static/openapi.json'
@@ -47,24 +89,10 @@ RATE_LIMIT_WINDOW = 3 * 60 * 60  # 3 hours in seconds
 UNAUTHENTICATED_LIMIT = 5  # requests per IP per window
 AUTHENTICATED_LIMIT = 10   # requests per user per window
 
-# In-memory rate limiting storage
-# Format: {key: [(timestamp, request_count), ...]}
-rate_limit_storage = defaultdict(list)
-
-def cleanup_rate_limit_storage():
-    """Clean up old entries from rate limit storage"""
-    current_time = time.time()
-    cutoff_time = current_time - RATE_LIMIT_WINDOW
-    
-    for key in list(rate_limit_storage.keys()):
-        # Remove entries older than the rate limit window
-        rate_limit_storage[key] = [
-            (timestamp, count) for timestamp, count in rate_limit_storage[key]
-            if timestamp > cutoff_time
-        ]
-        # Remove empty entries
-        if not rate_limit_storage[key]:
-            del rate_limit_storage[key]
+# Sliding-window rate limiting, O(1) per check
+# Counters live in the backend chosen by RATE_LIMIT_BACKEND: memory (this process),
+# shm (all workers on the host) or postgres (all replicas)
+ai_rate_limiter = create_limiter('ai', RATE_LIMIT_WINDOW)
 
 def get_client_ip():
     """Get client IP address, considering proxy headers"""
@@ -75,20 +103,35 @@ def get_client_ip():
     else:
         return request.remote_addr
 
+def client_ip_key():
+    return f"ip:{get_client_ip()}"
+
+# Route rate limits, enforced before the view runs (and before it touches the database)
+# Vulnerability: keyed on get_client_ip, which trusts X-Forwarded-For
+ROUTE_RATE_LIMITS = [
+    RateLimitPolicy('login', ['/login', '/api/login'], client_ip_key,
+                    window=300, limit=20, burst=5, methods=['POST']),
+    RateLimitPolicy('forgot-password', ['/forgot-password', '/api/v*/forgot-password'], client_ip_key,
+                    window=3600, limit=10, burst=2, methods=['POST']),
+    RateLimitPolicy('reset-password', ['/reset-password', '/api/v*/reset-password'], client_ip_key,
+                    window=3600, limit=20, burst=3, methods=['POST']),
+    RateLimitPolicy('check-balance', '/check_balance/<account_number>', client_ip_key,
+                    window=60, limit=60, burst=10),
+    RateLimitPolicy('transactions', '/transactions/<account_number>', client_ip_key,
+                    window=60, limit=60, burst=10),
+]
+
+init_rate_limiting(app, ROUTE_RATE_LIMITS)
+
 def check_rate_limit(key, limit):
-    """Check if the request should be rate limited"""
-    cleanup_rate_limit_storage()
-    current_time = time.time()
-    
-    # Count requests in the current window
-    request_count = sum(count for timestamp, count in rate_limit_storage[key] if timestamp > current_time - RATE_LIMIT_WINDOW)
-    
-    if request_count >= limit:
-        return False, request_count, limit
-    
-    # Add current request
-    rate_limit_storage[key].append((current_time, 1))
-    return True, request_count + 1, limit
+    """
+    Check if the request should be rate limited
+    Returns (allowed, request_count, limit); denied requests are not counted
+    The result also feeds the response's RateLimit-* headers
+    """
+    result = ai_rate_limiter.hit(key, limit)
+    note_rate_limit(result, RATE_LIMIT_WINDOW)
+    return result.allowed, result.count, result.limit
 
 def ai_rate_limit(f):
     """Rate limiting decorator for AI endpoints"""
@@ -96,52 +139,45 @@ def ai_rate_limit(f):
     def decorated_function(*args, **kwargs):
         client_ip = get_client_ip()
         
-        # Check if this is an authenticated request
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            # Extract token and get user info
-            token = auth_header.split(' ')[1]
-            try:
-                user_data = verify_token(token)
-                if user_data:
-                    # Authenticated mode: rate limit by both user and IP
-                    user_key = f"ai_auth_user_{user_data['user_id']}"
-                    ip_key = f"ai_auth_ip_{client_ip}"
-                    
-                    # Check user-based rate limit
-                    user_allowed, user_count, user_limit = check_rate_limit(user_key, AUTHENTICATED_LIMIT)
-                    if not user_allowed:
-                        return jsonify({
-                            'status': 'error',
-                            'message': f'Rate limit exceeded for user. You have made {user_count} requests in the last 3 hours. Limit is {user_limit} requests per 3 hours.',
-                            'rate_limit_info': {
-                                'limit_type': 'authenticated_user',
-                                'current_count': user_count,
-                                'limit': user_limit,
-                                'window_hours': 3,
-                                'user_id': user_data['user_id']
-                            }
-                        }), 429
-                    
-                    # Check IP-based rate limit
-                    ip_allowed, ip_count, ip_limit = check_rate_limit(ip_key, AUTHENTICATED_LIMIT)
-                    if not ip_allowed:
-                        return jsonify({
-                            'status': 'error',
-                            'message': f'Rate limit exceeded for IP address. This IP has made {ip_count} requests in the last 3 hours. Limit is {ip_limit} requests per 3 hours.',
-                            'rate_limit_info': {
-                                'limit_type': 'authenticated_ip',
-                                'current_count': ip_count,
-                                'limit': ip_limit,
-                                'window_hours': 3,
-                                'client_ip': client_ip
-                            }
-                        }), 429
-                    
-                    # Both checks passed, proceed with authenticated function
-                    return f(*args, **kwargs)
-            except:
-                pass  # Fall through to unauthenticated handling
+        # Check if this is an authenticated request (resolved once, shared with token_required)
+        user_data = get_auth_context().user
+        if user_data and 'user_id' in user_data:
+            # Authenticated mode: rate limit by both user and IP
+            user_key = f"ai_auth_user_{user_data['user_id']}"
+            ip_key = f"ai_auth_ip_{client_ip}"
+            
+            # Check user-based rate limit
+            user_allowed, user_count, user_limit = check_rate_limit(user_key, AUTHENTICATED_LIMIT)
+            if not user_allowed:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Rate limit exceeded for user. You have made {user_count} requests in the last 3 hours. Limit is {user_limit} requests per 3 hours.',
+                    'rate_limit_info': {
+                        'limit_type': 'authenticated_user',
+                        'current_count': user_count,
+                        'limit': user_limit,
+                        'window_hours': 3,
+                        'user_id': user_data['user_id']
+                    }
+                }), 429
+            
+            # Check IP-based rate limit
+            ip_allowed, ip_count, ip_limit = check_rate_limit(ip_key, AUTHENTICATED_LIMIT)
+            if not ip_allowed:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Rate limit exceeded for IP address. This IP has made {ip_count} requests in the last 3 hours. Limit is {ip_limit} requests per 3 hours.',
+                    'rate_limit_info': {
+                        'limit_type': 'authenticated_ip',
+                        'current_count': ip_count,
+                        'limit': ip_limit,
+                        'window_hours': 3,
+                        'client_ip': client_ip
+                    }
+                }), 429
+            
+            # Both checks passed, proceed with authenticated function
+            return f(*args, **kwargs)
         
         # Unauthenticated mode: rate limit by IP only
         ip_key = f"ai_unauth_ip_{client_ip}"
@@ -183,6 +219,51 @@ def generate_cvv():
     # Vulnerability: Predictable CVV generation
     return ''.join(random.choices(string.digits, k=3))
 
+# Rows serialised per chunk when streaming JSON responses
+STREAM_CHUNK_ROWS = 100
+
+def stream_json(envelope, list_key, rows, serialize, trailer=None):
+    """
+    Stream a JSON object whose `list_key` array is built from `rows` as they arrive
+    envelope: the other top-level keys, written before the array
+    serialize: callable turning one row into a dict; values may be Decimal or datetime (see json_provider)
+    trailer: optional callable returning keys known only after the rows (e.g. next_cursor)
+    """
+    def generate():
+        head = json.dumps(envelope)
+        yield head[:-1] + (', ' if envelope else '') + json.dumps(list_key) + ': ['
+        chunk = []
+        first = True
+        for row in rows:
+            chunk.append(serialize(row))
+            if len(chunk) >= STREAM_CHUNK_ROWS:
+                # One encoder call per chunk; the list brackets are dropped
+                yield ('' if first else ', ') + json.dumps(chunk)[1:-1]
+                first = False
+                chunk = []
+        if chunk:
+            yield ('' if first else ', ') + json.dumps(chunk)[1:-1]
+        tail = trailer() if trailer else {}
+        yield '], ' + json.dumps(tail)[1:] if tail else ']}'
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    # Release a streaming cursor even if the body is never iterated
+    if hasattr(rows, 'close'):
+        response.call_on_close(rows.close)
+    return response
+
+def stream_template(template_name, **context):
+    """Render a template incrementally (Flask 2.0 has no stream_template)"""
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_CHUNK_ROWS)
+    response = Response(stream_with_context(stream))
+    for value in context.values():
+        if hasattr(value, 'close'):
+            response.call_on_close(value.close)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -332,29 +413,196 @@ def login():
 
 @app.route('/debug/users')
 def debug_users():
-    users = execute_query("SELECT id, username, password, account_number, is_admin FROM users")
-    return jsonify({'users': [
-        {
-            'id': u[0],
-            'username': u[1],
-            'password': u[2],
-            'account_number': u[3],
-            'is_admin': u[4]
-        } for u in users
-    ]})
+    users = stream_query("SELECT id, username, password, account_number, is_admin FROM users", category='admin')
+    return stream_json({}, 'users', users, lambda u: {
+        'id': u[0],
+        'username': u[1],
+        'password': u[2],
+        'account_number': u[3],
+        'is_admin': u[4]
+    })
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving; never touches the database"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: this worker has a connection pool and the schema is current"""
+    # Vulnerability: Startup errors (hosts, credentials in DSN errors) exposed without authentication
+    readiness = get_readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
+@app.route('/debug/pool-stats')
+def debug_pool_stats():
+    # Vulnerability: No authentication on internal metrics
+    return jsonify(get_pool_stats())
+
+@app.route('/debug/query-stats')
+def debug_query_stats():
+    # Vulnerability: No authentication, exposes query shapes and timings
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'queries': get_query_stats(limit), 'timeouts': get_timeout_stats()})
+
+@app.route('/debug/rate-limit-stats')
+def debug_rate_limit_stats():
+    # Vulnerability: No authentication on internal metrics
+    return jsonify({
+        'ai': ai_rate_limiter.stats(),
+        'routes': {policy.name: policy.stats() for policy in ROUTE_RATE_LIMITS}
+    })
+
+@app.route('/debug/user-cache-stats')
+def debug_user_cache_stats():
+    # Vulnerability: No authentication on internal metrics
+    return jsonify(get_user_cache_stats())
+
+@app.route('/debug/revocation-stats')
+def debug_revocation_stats():
+    # Vulnerability: No authentication on internal metrics
+    return jsonify(get_revocation_stats())
+
+@app.route('/debug/token-cache-stats')
+def debug_token_cache_stats():
+    # Vulnerability: No authentication on internal metrics
+    return jsonify(get_token_cache_stats())
+
+def all_rate_limiters():
+    limiters = [ai_rate_limiter]
+    for policy in ROUTE_RATE_LIMITS:
+        limiters.append(policy.limiter)
+        if policy.burst_limiter is not None:
+            limiters.append(policy.burst_limiter)
+    return limiters
+
+_rate_limit_snapshot = {'at': 0.0, 'stats': []}
+
+def rate_limiter_stats():
+    """Stats of every limiter, reused for a second: shm and postgres stats scan their store"""
+    now = time.monotonic()
+    if now - _rate_limit_snapshot['at'] > 1.0:
+        _rate_limit_snapshot['stats'] = [limiter.stats() for limiter in all_rate_limiters()]
+        _rate_limit_snapshot['at'] = now
+    return _rate_limit_snapshot['stats']
+
+def pool_samples(key):
+    stats = get_pool_stats()
+    return [((), stats[key])] if key in stats else []
+
+def cache_samples(key):
+    return [
+        (('token',), get_token_cache_stats()[key]),
+        (('user',), get_user_cache_stats()[key])
+    ]
+
+def rate_limit_samples(*keys):
+    samples = []
+    for stats in rate_limiter_stats():
+        value = next((stats[key] for key in keys if stats.get(key) is not None), None)
+        if value is not None:
+            samples.append(((stats['name'], stats['backend']), value))
+    return samples
+
+# Gauges read at scrape time from the stats the /debug endpoints already expose
+metrics_registry.gauge('vulnbank_db_pool_connections_in_use', 'Pooled connections checked out',
+                       callback=lambda: pool_samples('in_use'))
+metrics_registry.gauge('vulnbank_db_pool_connections_idle', 'Pooled connections waiting to be checked out',
+                       callback=lambda: pool_samples('idle'))
+metrics_registry.gauge('vulnbank_db_pool_max_connections', 'Pool size limit',
+                       callback=lambda: pool_samples('max_connections'))
+metrics_registry.counter('vulnbank_db_pool_checkouts_total', 'Connections checked out of the pool',
+                         callback=lambda: pool_samples('checkouts'))
+metrics_registry.counter('vulnbank_db_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection',
+                         callback=lambda: pool_samples('timeouts'))
+metrics_registry.histogram('vulnbank_db_pool_wait_seconds', 'Time spent waiting for a pooled connection',
+                           callback=lambda: pool_samples('wait_time_seconds'))
+metrics_registry.counter('vulnbank_db_statement_timeouts_total', 'Statements cancelled by statement_timeout',
+                         ('category',),
+                         callback=lambda: [((category,), stats['timeouts']) for category, stats in get_timeout_stats().items()])
+metrics_registry.gauge('vulnbank_db_ready', 'Whether this worker has a connection pool and a current schema',
+                       callback=lambda: [((), is_database_ready())])
+
+metrics_registry.gauge('vulnbank_cache_entries', 'Entries held by in-process caches', ('cache',),
+                       callback=lambda: cache_samples('size'))
+metrics_registry.counter('vulnbank_cache_hits_total', 'Cache lookups answered from memory', ('cache',),
+                         callback=lambda: cache_samples('hits'))
+metrics_registry.counter('vulnbank_cache_misses_total', 'Cache lookups that fell through', ('cache',),
+                         callback=lambda: cache_samples('misses'))
+metrics_registry.counter('vulnbank_cache_evictions_total', 'Entries evicted to stay within the size limit', ('cache',),
+                         callback=lambda: cache_samples('evictions'))
+
+metrics_registry.gauge('vulnbank_rate_limit_keys', 'Keys tracked by each rate limiter', ('limiter', 'backend'),
+                       callback=lambda: rate_limit_samples('keys', 'live_keys'))
+metrics_registry.gauge('vulnbank_rate_limit_store_bytes', 'Memory held by each rate limiter store', ('limiter', 'backend'),
+                       callback=lambda: rate_limit_samples('approx_bytes', 'bytes'))
+metrics_registry.counter('vulnbank_rate_limit_evictions_total', 'Live keys dropped to make room', ('limiter', 'backend'),
+                         callback=lambda: rate_limit_samples('evictions'))
+metrics_registry.counter('vulnbank_rate_limit_expired_total', 'Idle keys removed by the sweeper', ('limiter', 'backend'),
+                         callback=lambda: rate_limit_samples('expired'))
+
+metrics_registry.gauge('vulnbank_revocation_filter_entries', 'Revoked token ids in the Bloom filter',
+                       callback=lambda: [((), get_revocation_stats()['entries'])])
+metrics_registry.counter('vulnbank_revocation_checks_total', 'Tokens checked against the revocation list',
+                         callback=lambda: [((), get_revocation_stats()['checks'])])
+metrics_registry.counter('vulnbank_revocation_database_lookups_total', 'Bloom filter hits confirmed in the database',
+                         callback=lambda: [((), get_revocation_stats()['filter_hits'])])
+metrics_registry.counter('vulnbank_revocation_false_positives_total', 'Bloom filter hits that were not revoked',
+                         callback=lambda: [((), get_revocation_stats()['false_positives'])])
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Prometheus text exposition of request, pool, cache, rate limit and AI upstream metrics
+    Values are per worker process; scrape each pod and aggregate in queries
+    """
+    # Vulnerability: No authentication on internal metrics
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.errorhandler(QueryTimeoutError)
+def handle_query_timeout(error):
+    # Cancelled by statement_timeout: report it as a temporary failure instead of a generic 500
+    print(f"Query timeout ({error.category}, {error.timeout_ms} ms): {error}")
+    return jsonify({
+        'status': 'error',
+        'message': 'The database took too long to respond, please try again'
+    }), 503
+
+@app.after_request
+def query_timeout_response(response):
+    """
+    Turn a view's own 500 into the timeout 503 when a query timed out
+    Most views catch Exception, and with it QueryTimeoutError, before the
+    error handler above can see it. Registered after the other hooks so it
+    runs before them and they see the 503.
+    """
+    error = get_request_timeout()
+    if error is None or response.status_code != 500:
+        return response
+    return make_response(handle_query_timeout(error))
+
+@app.errorhandler(RevocationCheckError)
+def handle_revocation_check_error(error):
+    # The token may or may not be revoked: a 401 would make clients discard a valid token
+    return jsonify({
+        'status': 'error',
+        'message': 'Could not verify the token right now, please try again'
+    }), 503
 
 @app.route('/dashboard')
 @token_required
 def dashboard(current_user):
     # Vulnerability: No input validation on user_id
-    user = execute_query(
-        "SELECT * FROM users WHERE id = %s",
-        (current_user['user_id'],)
-    )[0]
+    # Served from the user cache. Writes invalidate it only in the worker that
+    # made them, so a balance changed through another worker can show here for
+    # up to USER_CACHE_TTL seconds; money checks read the primary instead
+    user = get_user(current_user['user_id'])
     
     loans = execute_query(
         "SELECT * FROM loans WHERE user_id = %s",
-        (current_user['user_id'],)
+        (current_user['user_id'],),
+        prepare=True,
+        category='interactive'
     )
     
     # Create a user dictionary with all fields
@@ -383,7 +631,8 @@ def check_balance(account_number):
     try:
         # Vulnerability: SQL Injection possible
         user = execute_query(
-            f"SELECT username, balance FROM users WHERE account_number='{account_number}'"
+            f"SELECT username, balance FROM users WHERE account_number='{account_number}'",
+            category='interactive'
         )
         
         if user:
@@ -391,7 +640,7 @@ def check_balance(account_number):
             return jsonify({
                 'status': 'success',
                 'username': user[0][0],
-                'balance': float(user[0][1]),
+                'balance': user[0][1],
                 'account_number': account_number
             })
         return jsonify({
@@ -417,9 +666,14 @@ def transfer(current_user):
         
         # Get sender's account number
         # Race condition vulnerability in checking balance
+        # Read from the primary, not the user cache: another worker's cache may
+        # still hold the balance from before a transfer it did not make
         sender_data = execute_query(
             "SELECT account_number, balance FROM users WHERE id = %s",
-            (current_user['user_id'],)
+            (current_user['user_id'],),
+            prepare=True,
+            primary=True,
+            category='interactive'
         )[0]
         
         from_account = sender_data[0]
@@ -446,7 +700,8 @@ def transfer(current_user):
                          data.get('description', 'Transfer'))
                     )
                 ]
-                execute_transaction(queries)
+                execute_transaction(queries, prepare=True, category='interactive')
+                invalidate_user(current_user['user_id'], account_number=to_account)
                 
                 return jsonify({
                     'status': 'success',
@@ -476,6 +731,12 @@ def transfer(current_user):
 def get_transaction_history(account_number):
     # Vulnerability: No authentication required (BOLA)
     # Vulnerability: SQL Injection possible
+    query = None
+    try:
+        limit, position = get_page_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
     try:
         query = f"""
             SELECT 
@@ -487,30 +748,29 @@ def get_transaction_history(account_number):
                 transaction_type,
                 description
             FROM transactions 
-            WHERE from_account='{account_number}' OR to_account='{account_number}'
-            ORDER BY timestamp DESC
+            WHERE (from_account='{account_number}' OR to_account='{account_number}')
+            {keyset_condition('timestamp', 'id', position)}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT {limit + 1}
         """
         
-        transactions = execute_query(query)
+        transactions = KeysetPage(execute_query(query), limit, lambda t: (t[4], t[0]))
         
         # Vulnerability: Information disclosure
-        transaction_list = [{
+        return stream_json({
+            'status': 'success',
+            'account_number': account_number,
+            'server_time': str(datetime.now())  # Vulnerability: Server information disclosure
+        }, 'transactions', transactions, lambda t: {
             'id': t[0],
             'from_account': t[1],
             'to_account': t[2],
-            'amount': float(t[3]),
-            'timestamp': str(t[4]),
+            'amount': t[3],
+            'timestamp': t[4],
             'type': t[5],
             'description': t[6]
             #'query_used': query  # Vulnerability: Exposing SQL query
-        } for t in transactions]
-        
-        return jsonify({
-            'status': 'success',
-            'account_number': account_number,
-            'transactions': transaction_list,
-            'server_time': str(datetime.now())  # Vulnerability: Server information disclosure
-        })
+        }, trailer=lambda: {'next_cursor': transactions.next_cursor})
         
     except Exception as e:
         return jsonify({
@@ -552,6 +812,7 @@ def upload_profile_picture(current_user):
             (filename, current_user['user_id']),
             fetch=False
         )
+        invalidate_user(current_user['user_id'])
         
         return jsonify({
             'status': 'success',
@@ -602,10 +863,10 @@ def admin_panel(current_user):
     if not current_user['is_admin']:
         return "Access Denied", 403
         
-    users = execute_query("SELECT * FROM users")
-    pending_loans = execute_query("SELECT * FROM loans WHERE status='pending'")
+    pending_loans = execute_query("SELECT * FROM loans WHERE status='pending'", category='admin')
+    users = stream_query("SELECT * FROM users", category='admin')
     
-    return render_template('admin.html', users=users, pending_loans=pending_loans)
+    return stream_template('admin.html', users=users, pending_loans=pending_loans)
 
 @app.route('/admin/approve_loan/<int:loan_id>', methods=['POST'])
 @token_required
@@ -618,7 +879,8 @@ def approve_loan(current_user, loan_id):
         # Vulnerability: No validation if loan is already approved
         loan = execute_query(
             "SELECT * FROM loans WHERE id = %s",
-            (loan_id,)
+            (loan_id,),
+            primary=True
         )[0]
         
         if loan:
@@ -635,20 +897,21 @@ def approve_loan(current_user, loan_id):
                 )
             ]
             execute_transaction(queries)
+            invalidate_user(loan[1])
             
             return jsonify({
                 'status': 'success',
                 'message': 'Loan approved successfully',
                 'debug_info': {  # Vulnerability: Information disclosure
                     'loan_id': loan_id,
-                    'loan_amount': float(loan[2]),
+                    'loan_amount': loan[2],
                     'user_id': loan[1],
                     'approved_by': current_user['username'],
                     'approved_at': str(datetime.now()),
                     'loan_details': {  # Excessive data exposure
                         'id': loan[0],
                         'user_id': loan[1],
-                        'amount': float(loan[2]),
+                        'amount': loan[2],
                         'status': loan[3]
                     }
                 }
@@ -686,6 +949,7 @@ def delete_account(current_user, user_id):
             (user_id,),
             fetch=False
         )
+        invalidate_user(user_id)
         
         return jsonify({
             'status': 'success',
@@ -762,6 +1026,7 @@ def forgot_password():
                     (reset_pin, username),
                     fetch=False
                 )
+                invalidate_user(username=username)
                 
                 # Vulnerability: Information disclosure
                 return jsonify({
@@ -800,7 +1065,7 @@ def reset_password():
             reset_pin = data.get('reset_pin')
             new_password = data.get('new_password')
             
-            # Vulnerability: No rate limiting on PIN attempts
+            # Vulnerability: PIN attempts are only rate limited per client IP (spoofable via X-Forwarded-For)
             # Vulnerability: Timing attack possible in PIN verification
             user = execute_query(
                 "SELECT id FROM users WHERE username = %s AND reset_pin = %s",
@@ -815,6 +1080,7 @@ def reset_password():
                     (new_password, username),
                     fetch=False
                 )
+                invalidate_user(username=username)
                 
                 return jsonify({
                     'status': 'success',
@@ -861,6 +1127,7 @@ def api_v1_forgot_password():
                 (reset_pin, username),
                 fetch=False
             )
+            invalidate_user(username=username)
             
             # Vulnerability: Information disclosure
             return jsonify({
@@ -910,6 +1177,7 @@ def api_v2_forgot_password():
                 (reset_pin, username),
                 fetch=False
             )
+            invalidate_user(username=username)
             
             # Fixed: No longer exposing PIN and PIN length in response
             return jsonify({
@@ -945,7 +1213,7 @@ def api_v1_reset_password():
         reset_pin = data.get('reset_pin')
         new_password = data.get('new_password')
         
-        # Vulnerability: No rate limiting on PIN attempts
+        # Vulnerability: PIN attempts are only rate limited per client IP (spoofable via X-Forwarded-For)
         # Vulnerability: Timing attack possible in PIN verification
         user = execute_query(
             "SELECT id FROM users WHERE username = %s AND reset_pin = %s",
@@ -960,6 +1228,7 @@ def api_v1_reset_password():
                 (new_password, username),
                 fetch=False
             )
+            invalidate_user(username=username)
             
             return jsonify({
                 'status': 'success',
@@ -1002,7 +1271,7 @@ def api_v2_reset_password():
         reset_pin = data.get('reset_pin')
         new_password = data.get('new_password')
         
-        # Vulnerability: No rate limiting on PIN attempts
+        # Vulnerability: PIN attempts are only rate limited per client IP (spoofable via X-Forwarded-For)
         # Vulnerability: Timing attack possible in PIN verification
         user = execute_query(
             "SELECT id FROM users WHERE username = %s AND reset_pin = %s",
@@ -1017,6 +1286,7 @@ def api_v2_reset_password():
                 (new_password, username),
                 fetch=False
             )
+            invalidate_user(username=username)
             
             # Fixed: Less excessive data exposure
             return jsonify({
@@ -1049,34 +1319,35 @@ def api_transactions(current_user):
     
     if not account_number:
         return jsonify({'error': 'Account number required'}), 400
+
+    try:
+        limit, position = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
         
     # Vulnerability: SQL Injection
     query = f"""
         SELECT * FROM transactions 
-        WHERE from_account='{account_number}' OR to_account='{account_number}'
-        ORDER BY timestamp DESC
+        WHERE (from_account='{account_number}' OR to_account='{account_number}')
+        {keyset_condition('timestamp', 'id', position)}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT {limit + 1}
     """
     
     try:
-        transactions = execute_query(query)
+        transactions = KeysetPage(execute_query(query), limit, lambda t: (t[4], t[0]))
         
-        # Convert Decimal objects to float for JSON serialization
-        transaction_list = []
-        for t in transactions:
-            transaction_list.append({
-                'id': t[0],
-                'from_account': t[1],
-                'to_account': t[2],
-                'amount': float(t[3]),
-                'timestamp': str(t[4]),
-                'transaction_type': t[5],
-                'description': t[6]
-            })
-        
-        return jsonify({
-            'transactions': transaction_list,
+        return stream_json({
             'account_number': account_number
-        })
+        }, 'transactions', transactions, lambda t: {
+            'id': t[0],
+            'from_account': t[1],
+            'to_account': t[2],
+            'amount': t[3],
+            'timestamp': t[4],
+            'transaction_type': t[5],
+            'description': t[6]
+        }, trailer=lambda: {'next_cursor': transactions.next_cursor})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1156,12 +1427,12 @@ def get_virtual_cards(current_user):
                 'card_number': card[2],
                 'cvv': card[3],
                 'expiry_date': card[4],
-                'limit': float(card[5]),
-                'balance': float(card[6]),
+                'limit': card[5],
+                'balance': card[6],
                 'is_frozen': card[7],
                 'is_active': card[8],
-                'created_at': str(card[9]),
-                'last_used_at': str(card[10]) if card[10] else None,
+                'created_at': card[9],
+                'last_used_at': card[10],
                 'card_type': card[11]
             } for card in cards]
         })
@@ -1207,6 +1478,11 @@ def toggle_card_freeze(current_user, card_id):
 @app.route('/api/virtual-cards/<int:card_id>/transactions', methods=['GET'])
 @token_required
 def get_card_transactions(current_user, card_id):
+    try:
+        limit, position = get_page_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
     try:
         # Vulnerability: BOLA - no verification if card belongs to user
         # Vulnerability: SQL Injection possible
@@ -1215,24 +1491,27 @@ def get_card_transactions(current_user, card_id):
             FROM card_transactions ct
             JOIN virtual_cards vc ON ct.card_id = vc.id
             WHERE ct.card_id = {card_id}
-            ORDER BY ct.timestamp DESC
+            {keyset_condition('ct.timestamp', 'ct.id', position)}
+            ORDER BY ct.timestamp DESC, ct.id DESC
+            LIMIT {limit + 1}
         """
         
-        transactions = execute_query(query)
+        transactions = KeysetPage(execute_query(query), limit, lambda t: (t[6], t[0]))
         
         # Vulnerability: Information disclosure
         return jsonify({
             'status': 'success',
             'transactions': [{
                 'id': t[0],
-                'amount': float(t[2]),
+                'amount': t[2],
                 'merchant': t[3],
                 'type': t[4],
                 'status': t[5],
-                'timestamp': str(t[6]),
+                'timestamp': t[6],
                 'description': t[7],
                 'card_number': t[8]
-            } for t in transactions]
+            } for t in transactions],
+            'next_cursor': transactions.next_cursor
         })
         
     except Exception as e:
@@ -1286,8 +1565,8 @@ def update_card_limit(current_user, card_id):
                     'updated_fields': updated_fields_list,  # Use list instead of dict_keys
                     'card_details': {
                         'id': result[0][0],
-                        'card_limit': float(result[0][5]),
-                        'current_balance': float(result[0][6]),
+                        'card_limit': result[0][5],
+                        'current_balance': result[0][6],
                         'is_frozen': result[0][7],
                         'is_active': result[0][8],
                         'card_type': result[0][11]
@@ -1347,8 +1626,8 @@ def get_billers_by_category(category_id):
                 'name': b[2],
                 'account_number': b[3],  # Vulnerability: Exposing account numbers
                 'description': b[4],
-                'minimum_amount': float(b[5]),
-                'maximum_amount': float(b[6]) if b[6] else None
+                'minimum_amount': b[5],
+                'maximum_amount': b[6] if b[6] else None
             } for b in billers]
         })
     except Exception as e:
@@ -1381,7 +1660,7 @@ def create_bill_payment(current_user):
                 FROM virtual_cards 
                 WHERE id = {card_id}
             """
-            card = execute_query(card_query)[0]
+            card = execute_query(card_query, primary=True)[0]
             
             if card[2]:  # is_frozen
                 return jsonify({
@@ -1402,7 +1681,7 @@ def create_bill_payment(current_user):
                 SELECT balance FROM users
                 WHERE id = {current_user['user_id']}
             """
-            user_balance = float(execute_query(user_query)[0][0])
+            user_balance = float(execute_query(user_query, primary=True)[0][0])
             
             if amount > user_balance:
                 return jsonify({
@@ -1451,7 +1730,9 @@ def create_bill_payment(current_user):
             queries.append((balance_update, (amount, current_user['user_id'])))
         
         # Vulnerability: No transaction atomicity
-        execute_transaction(queries)
+        execute_transaction(queries, prepare=True)
+        if payment_method != 'virtual_card':
+            invalidate_user(current_user['user_id'])
         
         # Vulnerability: Information disclosure
         return jsonify({
@@ -1477,7 +1758,11 @@ def create_bill_payment(current_user):
 @token_required
 def get_payment_history(current_user):
     try:
-        # Vulnerability: No pagination
+        limit, position = get_page_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    try:
         # Vulnerability: SQL injection possible
         query = f"""
             SELECT 
@@ -1490,28 +1775,29 @@ def get_payment_history(current_user):
             JOIN bill_categories bc ON b.category_id = bc.id
             LEFT JOIN virtual_cards vc ON bp.card_id = vc.id
             WHERE bp.user_id = {current_user['user_id']}
-            ORDER BY bp.created_at DESC
+            {keyset_condition('bp.created_at', 'bp.id', position)}
+            ORDER BY bp.created_at DESC, bp.id DESC
+            LIMIT {limit + 1}
         """
         
-        payments = execute_query(query)
+        payments = KeysetPage(execute_query(query), limit, lambda p: (p[8], p[0]))
         
         # Vulnerability: Excessive data exposure
-        return jsonify({
-            'status': 'success',
-            'payments': [{
-                'id': p[0],
-                'amount': float(p[3]),
-                'payment_method': p[4],
-                'card_number': p[13] if p[13] else None,
-                'reference': p[6],
-                'status': p[7],
-                'created_at': str(p[8]),
-                'processed_at': str(p[9]) if p[9] else None,
-                'description': p[10],
-                'biller_name': p[11],
-                'category_name': p[12]
-            } for p in payments]
-        })
+        return stream_json({
+            'status': 'success'
+        }, 'payments', payments, lambda p: {
+            'id': p[0],
+            'amount': p[3],
+            'payment_method': p[4],
+            'card_number': p[13] if p[13] else None,
+            'reference': p[6],
+            'status': p[7],
+            'created_at': p[8],
+            'processed_at': p[9],
+            'description': p[10],
+            'biller_name': p[11],
+            'category_name': p[12]
+        }, trailer=lambda: {'next_cursor': payments.next_cursor})
         
     except Exception as e:
         return jsonify({
@@ -1546,22 +1832,17 @@ def ai_chat_authenticated(current_user):
             }), 400
         
         # VULNERABILITY: Pass sensitive user context directly to AI
-        # Fetch fresh user data from database (VULNERABILITY: Additional DB query)
-        fresh_user_data = execute_query(
-            "SELECT id, username, account_number, balance, is_admin, profile_picture FROM users WHERE id = %s",
-            (current_user['user_id'],),
-            fetch=True
-        )
+        # Fetch user data through the user cache (VULNERABILITY: full row incl. password loaded)
+        user_data = get_user(current_user['user_id'])
         
-        if fresh_user_data:
-            user_data = fresh_user_data[0]
+        if user_data:
             user_context = {
                 'user_id': user_data[0],
                 'username': user_data[1],
-                'account_number': user_data[2],
-                'balance': float(user_data[3]) if user_data[3] else 0.0,
-                'is_admin': bool(user_data[4]),
-                'profile_picture': user_data[5]
+                'account_number': user_data[3],
+                'balance': float(user_data[4]) if user_data[4] else 0.0,
+                'is_admin': bool(user_data[5]),
+                'profile_picture': user_data[6]
             }
         else:
             # Fallback to token data if DB query fails
@@ -1675,11 +1956,11 @@ def ai_rate_limit_status():
     """
     Check current rate limit status for AI endpoints
     Useful for debugging and transparency
+    Reads the limiter's running counts (O(1) per key); AI responses carry the
+    same numbers in RateLimit-* headers, so clients need not poll this
     """
     try:
-        cleanup_rate_limit_storage()
         client_ip = get_client_ip()
-        current_time = time.time()
         
         status = {
             'status': 'success',
@@ -1701,37 +1982,31 @@ def ai_rate_limit_status():
         
         # Check unauthenticated rate limit
         unauth_key = f"ai_unauth_ip_{client_ip}"
-        unauth_count = sum(count for timestamp, count in rate_limit_storage[unauth_key] 
-                          if timestamp > current_time - RATE_LIMIT_WINDOW)
-        status['rate_limits']['unauthenticated']['requests_made'] = unauth_count
-        status['rate_limits']['unauthenticated']['remaining'] = max(0, UNAUTHENTICATED_LIMIT - unauth_count)
+        unauth = ai_rate_limiter.peek(unauth_key, UNAUTHENTICATED_LIMIT)
+        status['rate_limits']['unauthenticated']['requests_made'] = unauth.count
+        status['rate_limits']['unauthenticated']['remaining'] = max(0, UNAUTHENTICATED_LIMIT - unauth.count)
+        status['rate_limits']['unauthenticated']['reset_seconds'] = math.ceil(unauth.reset_after)
         
         # Check if user is authenticated
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            try:
-                user_data = verify_token(token)
-                if user_data:
-                    # Check authenticated rate limits
-                    user_key = f"ai_auth_user_{user_data['user_id']}"
-                    ip_key = f"ai_auth_ip_{client_ip}"
-                    
-                    user_count = sum(count for timestamp, count in rate_limit_storage[user_key] 
-                                   if timestamp > current_time - RATE_LIMIT_WINDOW)
-                    ip_count = sum(count for timestamp, count in rate_limit_storage[ip_key] 
-                                 if timestamp > current_time - RATE_LIMIT_WINDOW)
-                    
-                    status['rate_limits']['authenticated']['user_requests_made'] = user_count
-                    status['rate_limits']['authenticated']['ip_requests_made'] = ip_count
-                    status['rate_limits']['authenticated']['user_remaining'] = max(0, AUTHENTICATED_LIMIT - user_count)
-                    status['rate_limits']['authenticated']['ip_remaining'] = max(0, AUTHENTICATED_LIMIT - ip_count)
-                    status['authenticated_user'] = {
-                        'user_id': user_data['user_id'],
-                        'username': user_data['username']
-                    }
-            except:
-                pass  # Token invalid, stay with unauthenticated status
+        user_data = get_auth_context().user
+        if user_data and 'user_id' in user_data:
+            # Check authenticated rate limits
+            user_key = f"ai_auth_user_{user_data['user_id']}"
+            ip_key = f"ai_auth_ip_{client_ip}"
+            
+            user = ai_rate_limiter.peek(user_key, AUTHENTICATED_LIMIT)
+            ip = ai_rate_limiter.peek(ip_key, AUTHENTICATED_LIMIT)
+            
+            status['rate_limits']['authenticated']['user_requests_made'] = user.count
+            status['rate_limits']['authenticated']['ip_requests_made'] = ip.count
+            status['rate_limits']['authenticated']['user_remaining'] = max(0, AUTHENTICATED_LIMIT - user.count)
+            status['rate_limits']['authenticated']['ip_remaining'] = max(0, AUTHENTICATED_LIMIT - ip.count)
+            status['rate_limits']['authenticated']['user_reset_seconds'] = math.ceil(user.reset_after)
+            status['rate_limits']['authenticated']['ip_reset_seconds'] = math.ceil(ip.reset_after)
+            status['authenticated_user'] = {
+                'user_id': user_data['user_id'],
+                'username': user_data.get('username')
+            }
         
         return jsonify(status)
         
@@ -1742,7 +2017,7 @@ def ai_rate_limit_status():
         }), 500
 
 if __name__ == '__main__':
-    init_db()
-    init_auth_routes(app)
+    # Development server; production runs under gunicorn via wsgi.py
+    start_background_init()
     # Vulnerability: Debug mode enabled in production
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
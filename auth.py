@@ -1,8 +1,16 @@
-from flask import jsonify, request
+from flask import g, jsonify, request
 import jwt
 import datetime
-import sqlite3  
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from functools import wraps
+from database import execute_query, execute_transaction
+from user_cache import invalidate_user
+from revocation import is_token_revoked, revoke_token, RevocationCheckError
 
 # Vulnerable JWT implementation with common security issues
 
@@ -16,26 +24,117 @@ def generate_token(user_id, username, is_admin=False):
     """
     Generate a JWT token with weak implementation
     Vulnerability: No token expiration (CWE-613)
+    The jti claim identifies the token for revocation (see revocation.py)
     """
     payload = {
         'user_id': user_id,
         'username': username,
         'is_admin': is_admin,
         # Missing 'exp' claim - tokens never expire
-        'iat': datetime.datetime.utcnow()
+        'iat': datetime.datetime.utcnow(),
+        'jti': uuid.uuid4().hex
     }
     
     # Vulnerability: Using a weak secret key
     token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
     return token
 
+# Verified-token cache: skips jwt.decode for tokens seen recently
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '300'))
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified token payloads with a per-entry TTL
+    Keys are SHA-256 digests of the token so raw tokens are not kept in memory
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # digest -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Callers get their own copy, handlers are free to modify it
+            return dict(entry[1])
+
+    def put(self, token, payload):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(payload))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else None
+            }
+
+
+token_cache = TokenCache()
+
+
+def get_token_cache_stats():
+    return token_cache.stats()
+
+
 def verify_token(token):
     """
     Verify JWT token with multiple vulnerabilities
     - Accepts 'none' algorithm (CWE-347)
     - No signature verification in some cases
     - No expiration check
+    Payloads are cached for TOKEN_CACHE_TTL seconds; failed verifications are not cached
     """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    payload = _decode_token(token)
+    if payload is not None:
+        token_cache.put(token, payload)
+    return payload
+
+
+def _decode_token(token):
     try:
         # Vulnerability: Accepts any algorithm, including 'none'
         payload = jwt.decode(token, JWT_SECRET, algorithms=ALGORITHMS)
@@ -54,53 +153,107 @@ def verify_token(token):
         return None
 
 
+def get_request_token():
+    """
+    Return the raw token for the current request, or None
+    Single definition of where tokens are accepted, in order:
+    Authorization header, query string, form data, cookie
+    """
+    token = None
+    
+    # Try to get token from Authorization header
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        try:
+            # Handle 'Bearer' token format
+            if 'Bearer' in auth_header:
+                token = auth_header.split(' ')[1]
+            else:
+                token = auth_header
+        except IndexError:
+            token = None
+            
+    # Vulnerability: Multiple token locations (token hijacking risk)
+    # Also check query parameters (vulnerable by design)
+    if not token and 'token' in request.args:
+        token = request.args['token']
+        
+    # Also check form data (vulnerable by design)
+    if not token and 'token' in request.form:
+        token = request.form['token']
+        
+    # Also check cookies (vulnerable by design)
+    if not token and 'token' in request.cookies:
+        token = request.cookies['token']
+        
+    return token
+
+
+class AuthContext:
+    """Token and verified payload for one request (user is None when unauthenticated)"""
+
+    def __init__(self, token, user, error=None, revoked=False):
+        self.token = token
+        self.user = user
+        self.error = error
+        self.revoked = revoked
+
+    @property
+    def authenticated(self):
+        return self.user is not None
+
+
+def get_auth_context():
+    """
+    Resolve the request's token once and keep the result on `g`
+    Stacked decorators and handlers all read the same context, so a request
+    costs at most one verify_token call
+    """
+    context = g.get('_auth_context')
+    if context is None:
+        token = get_request_token()
+        user = None
+        error = None
+        revoked = False
+        if token:
+            try:
+                user = verify_token(token)
+                # Bloom filter check; only possible revocations reach the database
+                if user is not None and is_token_revoked(user.get('jti')):
+                    user = None
+                    revoked = True
+            except RevocationCheckError:
+                raise  # Unknown, not invalid: answered with a 503, never a 401
+            except Exception as e:
+                error = str(e)
+        context = AuthContext(token, user, error, revoked)
+        g._auth_context = context
+    return context
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Try to get token from Authorization header
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                # Handle 'Bearer' token format
-                if 'Bearer' in auth_header:
-                    token = auth_header.split(' ')[1]
-                else:
-                    token = auth_header
-            except IndexError:
-                token = None
-                
-        # Vulnerability: Multiple token locations (token hijacking risk)
-        # Also check query parameters (vulnerable by design)
-        if not token and 'token' in request.args:
-            token = request.args['token']
-            
-        # Also check form data (vulnerable by design)
-        if not token and 'token' in request.form:
-            token = request.form['token']
+        context = get_auth_context()
             
-        # Also check cookies (vulnerable by design)
-        if not token and 'token' in request.cookies:
-            token = request.cookies['token']
-            
-        if not token:
+        if not context.token:
             return jsonify({'error': 'Token is missing'}), 401
 
-        try:
-            current_user = verify_token(token)
-            if current_user is None:
-                return jsonify({'error': 'Invalid token'}), 401
-                
-            # Vulnerability: No token expiration check
-            return f(current_user, *args, **kwargs)
-            
-        except Exception as e:
+        if context.error is not None:
             # Vulnerability: Detailed error exposure
             return jsonify({
                 'error': 'Invalid token', 
-                'details': str(e)
+                'details': context.error
             }), 401
+
+        if context.revoked:
+            return jsonify({'error': 'Token has been revoked'}), 401
+
+        if context.user is None:
+            return jsonify({'error': 'Invalid token'}), 401
+            
+        # Vulnerability: No token expiration check
+        return f(context.user, *args, **kwargs)
             
     return decorated
 
@@ -114,12 +267,9 @@ def init_auth_routes(app):
             return jsonify({'error': 'Missing credentials'}), 401
             
         # Vulnerability: SQL Injection still possible here
-        conn = sqlite3.connect('bank.db')
-        c = conn.cursor()
         query = f"SELECT * FROM users WHERE username='{auth.get('username')}' AND password='{auth.get('password')}'"
-        c.execute(query)
-        user = c.fetchone()
-        conn.close()
+        rows = execute_query(query, category='interactive')
+        user = rows[0] if rows else None
         
         if not user:
             return jsonify({'error': 'Invalid credentials'}), 401
@@ -141,6 +291,18 @@ def init_auth_routes(app):
             }
         })
 
+    @app.route('/api/logout', methods=['POST'])
+    @token_required
+    def api_logout(current_user):
+        # Revokes this token only; other tokens issued to the user stay valid
+        jti = current_user.get('jti')
+        if not jti:
+            return jsonify({'error': 'Token cannot be revoked (no jti claim)'}), 400
+        revoke_token(jti, current_user.get('user_id'))
+        response = jsonify({'status': 'success', 'message': 'Logged out'})
+        response.delete_cookie('token')
+        return response
+
     @app.route('/api/check_balance', methods=['GET'])
     @token_required
     def api_check_balance(current_user):
@@ -148,11 +310,11 @@ def init_auth_routes(app):
         # Any valid token can check any account balance
         account_number = request.args.get('account_number')
         
-        conn = sqlite3.connect('bank.db')
-        c = conn.cursor()
-        c.execute(f"SELECT username, balance FROM users WHERE account_number='{account_number}'")
-        user = c.fetchone()
-        conn.close()
+        rows = execute_query(
+            f"SELECT username, balance FROM users WHERE account_number='{account_number}'",
+            category='interactive'
+        )
+        user = rows[0] if rows else None
         
         if user:
             return jsonify({
@@ -174,24 +336,28 @@ def init_auth_routes(app):
         amount = float(data.get('amount'))
         to_account = data.get('to_account')
         
-        conn = sqlite3.connect('bank.db')
-        c = conn.cursor()
-        
         # Vulnerability: Race condition in transfer
-        c.execute(f"SELECT balance FROM users WHERE id={current_user['user_id']}")
-        balance = c.fetchone()[0]
+        balance = float(execute_query(
+            f"SELECT balance FROM users WHERE id={current_user['user_id']}",
+            primary=True,
+            category='interactive'
+        )[0][0])
         
         if balance >= amount:
             # Vulnerability: SQL injection possible in to_account
-            c.execute(f"UPDATE users SET balance = balance - {amount} WHERE id={current_user['user_id']}")
-            c.execute(f"UPDATE users SET balance = balance + {amount} WHERE account_number='{to_account}'")
-            conn.commit()
+            execute_transaction([
+                (f"UPDATE users SET balance = balance - {amount} WHERE id={current_user['user_id']}", None),
+                (f"UPDATE users SET balance = balance + {amount} WHERE account_number='{to_account}'", None)
+            ], category='interactive')
+            invalidate_user(current_user['user_id'], account_number=to_account)
             
             # Vulnerability: Information disclosure
-            c.execute(f"SELECT username, balance FROM users WHERE account_number='{to_account}'")
-            recipient = c.fetchone()
+            recipient = execute_query(
+                f"SELECT username, balance FROM users WHERE account_number='{to_account}'",
+                primary=True,
+                category='interactive'
+            )[0]
             
-            conn.close()
             return jsonify({
                 'status': 'success',
                 'new_balance': balance - amount,
@@ -199,5 +365,4 @@ def init_auth_routes(app):
                 'recipient_new_balance': recipient[1]
             })
             
-        conn.close()
         return jsonify({'error': 'Insufficient funds'}), 400
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Benchmark: serialising a 10k-row bill payment history
+
+Builds rows shaped like the /api/bill-payments/history query (Decimal
+amounts, datetime columns) and times turning them into a JSON body:
+
+  before     float()/str() on every field, one stdlib json.dumps per row
+             (the old stream_json loop)
+  stdlib     app.stream_json with FastJSONEncoder, without orjson
+  orjson     app.stream_json with FastJSONEncoder and orjson
+
+The "after" runs drive the app's own stream_json, so they use its chunk size
+(STREAM_CHUNK_ROWS). Importing the app does not connect to the database.
+
+Usage: python benchmarks/bench_json.py [rows]   (default: 10000)
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import json
+from flask.json import JSONEncoder
+
+import json_provider
+from app import app, stream_json, STREAM_CHUNK_ROWS
+
+ROUNDS = 5
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1, 9, 30)
+    return [(
+        i, 1, 3, Decimal(f"{i % 5000}.{i % 100:02d}"), 'balance', None,
+        f"BILL{i:08d}", 'completed', start + timedelta(minutes=i),
+        start + timedelta(minutes=i, seconds=3) if i % 3 else None,
+        'Monthly bill', 'City Power', 'Utilities', None
+    ) for i in range(count)]
+
+
+def serialize_before(p):
+    return {
+        'id': p[0],
+        'amount': float(p[3]),
+        'payment_method': p[4],
+        'card_number': p[13] if p[13] else None,
+        'reference': p[6],
+        'status': p[7],
+        'created_at': str(p[8]),
+        'processed_at': str(p[9]) if p[9] else None,
+        'description': p[10],
+        'biller_name': p[11],
+        'category_name': p[12]
+    }
+
+
+def serialize_after(p):
+    return {
+        'id': p[0],
+        'amount': p[3],
+        'payment_method': p[4],
+        'card_number': p[13] if p[13] else None,
+        'reference': p[6],
+        'status': p[7],
+        'created_at': p[8],
+        'processed_at': p[9],
+        'description': p[10],
+        'biller_name': p[11],
+        'category_name': p[12]
+    }
+
+
+def encode_before(rows):
+    return ', '.join(json.dumps(serialize_before(row)) for row in rows)
+
+
+def encode_after(rows):
+    response = stream_json({'status': 'success'}, 'payments', iter(rows), serialize_after)
+    return ''.join(response.response)
+
+
+def best_of(encode, rows):
+    best = float('inf')
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        encode(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = make_rows(count)
+    orjson = json_provider.orjson
+
+    print(f"{STREAM_CHUNK_ROWS} rows per stream_json chunk")
+    print(f"{'implementation':>16}{'ms':>10}{'us/row':>10}")
+    with app.test_request_context():
+        app.json_encoder = JSONEncoder
+        results = [('before', best_of(encode_before, rows))]
+
+        app.json_encoder = json_provider.FastJSONEncoder
+        json_provider.orjson = None
+        results.append(('stdlib', best_of(encode_after, rows)))
+        json_provider.orjson = orjson
+        if orjson is not None:
+            results.append(('orjson', best_of(encode_after, rows)))
+        else:
+            print("orjson is not installed; skipping")
+
+    for name, seconds in results:
+        print(f"{name:>16}{seconds * 1e3:>10.1f}{seconds / count * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: /transfer statements with and without the prepared statement cache
+
+Runs the transfer path (sender lookup, two balance UPDATEs, history INSERT)
+against the database in DB_CONFIG inside a transaction that is rolled back,
+so no data changes. Reports wall time per transfer and the server-side
+planning time Postgres reports for each statement.
+
+Usage: python benchmarks/bench_prepared_statements.py [iterations]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+TRANSFER_STATEMENTS = [
+    ("SELECT account_number, balance FROM users WHERE id = %s", (1,)),
+    ("UPDATE users SET balance = balance - %s WHERE id = %s", (0.0, 1)),
+    ("UPDATE users SET balance = balance + %s WHERE account_number = %s", (0.0, 'ADMIN001')),
+    ("""INSERT INTO transactions
+        (from_account, to_account, amount, transaction_type, description)
+        VALUES (%s, %s, %s, %s, %s)""", ('ADMIN001', 'ADMIN001', 0.0, 'transfer', 'benchmark')),
+]
+
+
+def run_transfers(conn, iterations, prepare):
+    with conn.cursor() as cursor:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for query, params in TRANSFER_STATEMENTS:
+                if prepare:
+                    cursor.execute(*database.prepared_sql(conn, query, params))
+                else:
+                    cursor.execute(query, params)
+        return (time.perf_counter() - start) / iterations
+
+
+def planning_time(conn, prepare):
+    """Sum of 'Planning Time' over the transfer statements, from EXPLAIN ANALYZE"""
+    total = 0.0
+    with conn.cursor() as cursor:
+        for query, params in TRANSFER_STATEMENTS:
+            if prepare:
+                sql, args = database.prepared_sql(conn, query, params)
+                # Statement is already prepared by the warm-up, only EXECUTE remains
+                sql = 'EXPLAIN (ANALYZE, SUMMARY) ' + sql
+            else:
+                sql, args = 'EXPLAIN (ANALYZE, SUMMARY) ' + query, params
+            cursor.execute(sql, args)
+            for (line,) in cursor.fetchall():
+                match = re.search(r'Planning Time: ([\d.]+) ms', line)
+                if match:
+                    total += float(match.group(1))
+    return total
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    database.init_connection_pool(min_connections=1, max_connections=1)
+    conn = database.get_connection()
+    try:
+        results = {}
+        for prepare in (False, True):
+            # Warm up (and, for the prepared run, let Postgres settle on a generic plan)
+            run_transfers(conn, 10, prepare)
+            per_transfer = run_transfers(conn, iterations, prepare)
+            results[prepare] = (per_transfer, planning_time(conn, prepare))
+            conn.rollback()
+            database._discard_prepared(conn)
+
+        print(f"{'mode':<12}{'ms/transfer':>14}{'planning ms/transfer':>24}")
+        for prepare, (per_transfer, planning) in results.items():
+            label = 'prepared' if prepare else 'plain'
+            print(f"{label:<12}{per_transfer * 1000:>14.3f}{planning:>24.3f}")
+        saved = results[False][0] - results[True][0]
+        print(f"saved {saved * 1000:.3f} ms per transfer ({iterations} iterations)")
+    finally:
+        conn.rollback()
+        database.return_connection(conn)
+        database.connection_pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
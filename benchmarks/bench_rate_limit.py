@@ -0,0 +1,80 @@
+"""
+Benchmark: rate limit check cost as the number of tracked keys grows
+
+Fills the limiter with N idle-but-unexpired keys, then times checks against
+random keys. The previous implementation (a list of timestamps per key,
+swept on every check) is timed alongside for comparison; its sweep touches
+every key, so it only gets a handful of iterations.
+
+Usage: python benchmarks/bench_rate_limit.py [keys ...]   (default: 10000 1000000)
+"""
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import SlidingWindowLimiter
+
+WINDOW = 3 * 60 * 60
+LIMIT = 10
+
+
+class ListLimiter:
+    """The old check_rate_limit: sweep every key, then sum the caller's list"""
+
+    def __init__(self, window):
+        self.window = window
+        self.storage = defaultdict(list)
+
+    def hit(self, key, limit):
+        current_time = time.time()
+        cutoff_time = current_time - self.window
+        for k in list(self.storage.keys()):
+            self.storage[k] = [(t, c) for t, c in self.storage[k] if t > cutoff_time]
+            if not self.storage[k]:
+                del self.storage[k]
+        request_count = sum(c for t, c in self.storage[key] if t > cutoff_time)
+        if request_count >= limit:
+            return False
+        self.storage[key].append((current_time, 1))
+        return True
+
+
+def fill(limiter, keys):
+    for i in range(keys):
+        limiter.hit(f"ai_auth_ip_10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", LIMIT)
+
+
+def time_checks(limiter, keys, iterations):
+    names = [f"ai_auth_ip_10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+             for i in (random.randrange(keys) for _ in range(iterations))]
+    start = time.perf_counter()
+    for name in names:
+        limiter.hit(name, LIMIT)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 1000000]
+    print(f"{'keys':>10}{'implementation':>18}{'us/check':>12}")
+    for keys in sizes:
+        # Hold every key: the default RATE_LIMIT_MAX_KEYS cap would turn the large runs into eviction churn
+        limiter = SlidingWindowLimiter(WINDOW, max_keys=keys)
+        fill(limiter, keys)
+        per_check = time_checks(limiter, keys, 100000)
+        print(f"{keys:>10}{'sliding window':>18}{per_check * 1e6:>12.2f}")
+
+        legacy = ListLimiter(WINDOW)
+        for i in range(keys):
+            legacy.storage[f"ai_auth_ip_10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"].append((time.time(), 1))
+        legacy_iterations = max(3, 200000 // keys)
+        per_check = time_checks(legacy, keys, legacy_iterations)
+        print(f"{keys:>10}{'list sweep':>18}{per_check * 1e6:>12.2f}")
+        del legacy, limiter
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import mimetypes
+import os
+import zlib
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+# Dynamic responses smaller than this are sent as is; compressing them saves
+# less than the headers and CPU cost
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+# Text formats worth compressing; images other than SVG are already compressed
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'text/javascript',
+    'text/css',
+    'text/html',
+    'text/plain',
+    'text/xml',
+    'application/xml',
+    'image/svg+xml',
+}
+
+# File suffix of each precompressed static variant (see precompress_static.py)
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def available_encodings():
+    """Encodings this server can produce, most preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(encodings):
+    """The client's best accepted encoding out of `encodings`, or None"""
+    accepted = request.accept_encodings
+    best = accepted.best_match(encodings)
+    if best is None or accepted[best] <= 0:
+        return None
+    return best
+
+
+def _add_vary(response):
+    response.vary.add('Accept-Encoding')
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(body, encoding, charset):
+    """
+    Compress a streamed body chunk by chunk
+    Each chunk is flushed so the client can start parsing before the stream ends
+    """
+    chunks = (chunk.encode(charset) if isinstance(chunk, str) else chunk for chunk in body)
+    try:
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            for chunk in chunks:
+                data = compressor.process(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+    finally:
+        # Closing the response closes this generator; pass that on to the view's stream
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def compress_response(response):
+    """
+    after_request hook: gzip or brotli encode dynamic text responses
+    Skips responses that are already encoded, files sent with send_file
+    (static assets are precompressed at build time instead), non-text types
+    and bodies under COMPRESSION_MIN_SIZE. Streamed bodies have no known size
+    and are always compressed.
+    """
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    _add_vary(response)
+    encoding = negotiate_encoding(available_encodings())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, response.charset)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """
+    Compress dynamic responses and serve precompressed static assets
+    The static view looks for `<file>.br` / `<file>.gz` next to the requested
+    file and sends the best one the client accepts with a matching
+    Content-Encoding. A variant older than its source file is ignored, so
+    edits in development are never shadowed by a stale build.
+    """
+    serve_static = app.view_functions['static']
+
+    def send_static(filename):
+        path = safe_join(app.static_folder, filename)
+        encodings = [
+            encoding for encoding, suffix in PRECOMPRESSED_SUFFIXES.items()
+            if path is not None and _is_fresh(path + suffix, path)
+        ]
+        encoding = negotiate_encoding(encodings) if encodings else None
+        if encoding is None:
+            response = serve_static(filename=filename)
+        else:
+            response = send_from_directory(
+                app.static_folder,
+                filename + PRECOMPRESSED_SUFFIXES[encoding],
+                mimetype=mimetypes.guess_type(filename)[0],
+                max_age=app.get_send_file_max_age(filename)
+            )
+            response.headers['Content-Encoding'] = encoding
+        if encodings:
+            _add_vary(response)
+        return response
+
+    app.view_functions['static'] = send_static
+    app.after_request(compress_response)
+
+
+def _is_fresh(variant, source):
+    try:
+        return os.stat(variant).st_mtime >= os.stat(source).st_mtime
+    except OSError:
+        return False
@@ -1,8 +1,17 @@
 import os
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 from psycopg2 import pool
 from datetime import datetime
+from collections import deque, OrderedDict
+import functools
+import itertools
+import re
+import threading
 import time
+from flask import g, has_request_context
+from metrics import Histogram
 
 # Vulnerable database configuration
 # CWE-259: Use of Hard-coded Password
@@ -15,25 +24,371 @@ DB_CONFIG = {
     'port': os.getenv('DB_PORT', '5432')
 }
 
+# Connection pool settings
+# DB_POOL_MODE: 'blocking' (thread-safe, queues callers) or 'simple' (legacy SimpleConnectionPool)
+POOL_MODE = os.getenv('DB_POOL_MODE', 'blocking')
+POOL_MIN_CONNECTIONS = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX_CONNECTIONS = int(os.getenv('DB_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds a caller waits for a free connection
+POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300'))  # seconds before surplus idle connections are closed
+
+# Prepared statements kept per connection (LRU, DEALLOCATEd on eviction)
+PREPARED_CACHE_SIZE = int(os.getenv('DB_PREPARED_CACHE_SIZE', '32'))
+
+# Optional read replicas: comma-separated libpq DSNs, e.g. "host=replica1 dbname=vulnerable_bank user=postgres"
+REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('DB_REPLICA_DSNS', '').split(',') if dsn.strip()]
+REPLICA_RETRY_INTERVAL = float(os.getenv('DB_REPLICA_RETRY_INTERVAL', '30'))  # seconds a failed replica is skipped
+# Seconds a read waits for a saturated replica's pool before trying the next replica or the primary
+REPLICA_POOL_TIMEOUT = float(os.getenv('DB_REPLICA_POOL_TIMEOUT', '0'))
+
+# Server-side statement timeouts (ms) per query category; 0 disables the limit
+STATEMENT_TIMEOUTS = {
+    'interactive': int(os.getenv('DB_TIMEOUT_INTERACTIVE_MS', '2000')),  # single-row lookups on user-facing paths
+    'default': int(os.getenv('DB_TIMEOUT_DEFAULT_MS', '5000')),
+    'ai': int(os.getenv('DB_TIMEOUT_AI_MS', '3000')),  # AI agent context queries (ILIKE scans)
+    'admin': int(os.getenv('DB_TIMEOUT_ADMIN_MS', '60000')),  # admin panel and exports
+}
+
+# Query instrumentation
+QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv('DB_QUERY_STATS_MAX', '500'))  # distinct statements tracked
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '500'))  # log statements slower than this
+SLOW_QUERY_LOG = os.getenv('DB_SLOW_QUERY_LOG', '')  # file to append slow queries to (stdout when empty)
+
+# Rows pulled per round trip by server-side (streaming) cursors
+STREAM_FETCH_SIZE = int(os.getenv('DB_STREAM_FETCH_SIZE', '500'))
+
+# Background startup: first retry delay and backoff cap (seconds) while the database is unreachable
+INIT_RETRY_DELAY = float(os.getenv('DB_INIT_RETRY_DELAY', '0.5'))
+INIT_MAX_RETRY_DELAY = float(os.getenv('DB_INIT_MAX_RETRY_DELAY', '10'))
+
 # Create a connection pool
 connection_pool = None
+replica_set = None
+# Pool wait accumulated by the current thread since its last recorded query
+_pending_wait = threading.local()
+_stream_cursor_ids = itertools.count()
+
+
+class PoolTimeoutError(pool.PoolError):
+    """Raised when no pooled connection becomes free within the pool timeout"""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection subclass carrying the bookkeeping the pool needs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self.checkout_wait = 0.0
+        # query text -> server-side prepared statement name, least recently used first
+        self.prepared_statements = OrderedDict()
+        self.prepared_ids = itertools.count()
+
+
+class BlockingConnectionPool:
+    """
+    Thread-safe connection pool that queues callers instead of failing
+    - getconn() blocks up to `timeout` seconds when all connections are checked out
+    - Idle connections above `minconn` are closed after `idle_timeout` seconds (reaped on return)
+    - Keeps counters and a wait time histogram for sizing the pool
+    """
+
+    def __init__(self, minconn, maxconn, timeout=POOL_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT, **kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise pool.PoolError("invalid pool size: min=%s max=%s" % (minconn, maxconn))
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.closed = False
+        self._kwargs = kwargs
+        self._idle = deque()  # Oldest idle connection on the left
+        self._in_use = 0      # Checked out connections, including ones still being opened
+        self._cond = threading.Condition()
+
+        # Counters
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.wait_time = Histogram()
+
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=PooledConnection, **self._kwargs)
+        with self._cond:
+            self.connections_created += 1
+        return conn
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise pool.PoolError("connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        # Dropped by the server while idle, discard it
+                        self.connections_closed += 1
+                        conn = None
+                        continue
+                    self._in_use += 1
+                    break
+                if self._in_use < self.maxconn:
+                    # Reserve a slot, the connection is opened outside the lock
+                    self._in_use += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time.observe(time.monotonic() - start)
+                    raise PoolTimeoutError(
+                        "no connection available within %.1f seconds (max %d)" % (timeout, self.maxconn)
+                    )
+                self._cond.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+        wait = time.monotonic() - start
+        conn.checkout_wait = wait
+        self.wait_time.observe(wait)
+        _pending_wait.seconds = getattr(_pending_wait, 'seconds', 0.0) + wait
+        with self._cond:
+            self.checkouts += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        if not conn.closed and not close:
+            # Same reset rules as psycopg2's own pools
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+
+        to_close = []
+        with self._cond:
+            self._in_use -= 1
+            now = time.monotonic()
+            if close or conn.closed or self.closed:
+                to_close.append(conn)
+            else:
+                conn.last_used = now
+                self._idle.append(conn)
+
+            # Reap surplus connections that have been idle too long
+            while (self._idle
+                   and len(self._idle) + self._in_use > self.minconn
+                   and now - self._idle[0].last_used > self.idle_timeout):
+                to_close.append(self._idle.popleft())
+
+            self.connections_closed += len(to_close)
+            self._cond.notify()
+
+        for stale in to_close:
+            if not stale.closed:
+                stale.close()
+
+    def closeall(self):
+        with self._cond:
+            self.closed = True
+            to_close = list(self._idle)
+            self._idle.clear()
+            self.connections_closed += len(to_close)
+            self._cond.notify_all()
+        for conn in to_close:
+            if not conn.closed:
+                conn.close()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            in_use = self._in_use
+            checkouts = self.checkouts
+            timeouts = self.timeouts
+            created = self.connections_created
+            closed = self.connections_closed
+        return {
+            'mode': 'blocking',
+            'min_connections': self.minconn,
+            'max_connections': self.maxconn,
+            'timeout_seconds': self.timeout,
+            'idle_timeout_seconds': self.idle_timeout,
+            'size': idle + in_use,
+            'in_use': in_use,
+            'idle': idle,
+            'checkouts': checkouts,
+            'timeouts': timeouts,
+            'connections_created': created,
+            'connections_closed': closed,
+            'wait_time_seconds': self.wait_time.snapshot()
+        }
+
+
+class QueryTimeoutError(Exception):
+    """A statement was cancelled by its statement_timeout"""
+
+    def __init__(self, message, category=None, timeout_ms=None):
+        super().__init__(message)
+        self.category = category
+        self.timeout_ms = timeout_ms
+
+
+def _timeout_error(message, category, timeout_ms):
+    """Build a QueryTimeoutError and remember it for the request (see get_request_timeout)"""
+    error = QueryTimeoutError(message, category, timeout_ms)
+    if has_request_context():
+        g._db_timeout = error
+    return error
+
+
+def get_request_timeout():
+    """The last QueryTimeoutError raised in this request, even if a view caught it, or None"""
+    return g.get('_db_timeout') if has_request_context() else None
+
+
+class ReplicaUnavailableError(Exception):
+    """No read replica can serve the query right now; callers fall back to the primary"""
+
+
+class DatabaseNotReadyError(Exception):
+    """A connection was requested before background initialisation created the pool"""
+
+
+class Replica:
+    """One read replica with a lazily created pool and passive health tracking"""
+
+    def __init__(self, dsn, maxconn):
+        self.dsn = dsn
+        self.host = psycopg2.extensions.parse_dsn(dsn).get('host', 'localhost')
+        self.maxconn = maxconn
+        self.pool = None
+        self.down_until = 0.0
+        self.reads = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def getconn(self):
+        with self._lock:
+            if self.pool is None:
+                # No queueing: a saturated replica should fail over, not stall the read
+                self.pool = BlockingConnectionPool(0, self.maxconn, timeout=REPLICA_POOL_TIMEOUT, dsn=self.dsn)
+        conn = self.pool.getconn()
+        with self._lock:
+            self.reads += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.pool.putconn(conn, close=close)
+
+    def mark_down(self, error):
+        with self._lock:
+            self.failures += 1
+            self.down_until = time.monotonic() + REPLICA_RETRY_INTERVAL
+        print(f"Read replica {self.host} marked down for {REPLICA_RETRY_INTERVAL}s: {error}")
+
+    def stats(self):
+        return {
+            'host': self.host,
+            'healthy': self.available(),
+            'reads': self.reads,
+            'failures': self.failures,
+            'pool': self.pool.stats() if self.pool else None
+        }
+
+
+class ReplicaSet:
+    """
+    Round-robin over read replicas
+    A replica that fails to connect or drops a connection is skipped for
+    DB_REPLICA_RETRY_INTERVAL seconds, after which the next checkout re-probes it
+    """
+
+    def __init__(self, dsns, maxconn):
+        self.replicas = [Replica(dsn, maxconn) for dsn in dsns]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        """Return (replica, connection) from the next healthy replica"""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if not replica.available():
+                continue
+            try:
+                return replica, replica.getconn()
+            except PoolTimeoutError:
+                # Saturated rather than unhealthy, try the next one
+                continue
+            except (psycopg2.OperationalError, pool.PoolError) as e:
+                replica.mark_down(e)
+        raise ReplicaUnavailableError("no healthy read replica available")
 
-def init_connection_pool(min_connections=1, max_connections=10, max_retries=5, retry_delay=2):
+    def closeall(self):
+        for replica in self.replicas:
+            if replica.pool:
+                replica.pool.closeall()
+
+    def stats(self):
+        return [replica.stats() for replica in self.replicas]
+
+
+def init_connection_pool(min_connections=None, max_connections=None, max_retries=5, retry_delay=2):
     """
     Initialize the database connection pool with retry mechanism
+    Pool size, mode and timeouts default to the DB_POOL_* environment variables
     Vulnerability: No connection encryption enforced
     """
-    global connection_pool
+    global connection_pool, replica_set
     retry_count = 0
+    min_connections = POOL_MIN_CONNECTIONS if min_connections is None else min_connections
+    max_connections = POOL_MAX_CONNECTIONS if max_connections is None else max_connections
     
     while retry_count < max_retries:
         try:
-            connection_pool = psycopg2.pool.SimpleConnectionPool(
-                min_connections,
-                max_connections,
-                **DB_CONFIG
-            )
+            if POOL_MODE == 'simple':
+                connection_pool = psycopg2.pool.SimpleConnectionPool(
+                    min_connections,
+                    max_connections,
+                    **DB_CONFIG
+                )
+            else:
+                connection_pool = BlockingConnectionPool(
+                    min_connections,
+                    max_connections,
+                    **DB_CONFIG
+                )
             print("Database connection pool created successfully")
+            if REPLICA_DSNS:
+                # Replica pools connect lazily; health is discovered on first use
+                replica_set = ReplicaSet(REPLICA_DSNS, max_connections)
+                print(f"Routing reads to {len(REPLICA_DSNS)} read replica(s)")
             return
         except Exception as e:
             retry_count += 1
@@ -45,217 +400,827 @@ def init_connection_pool(min_connections=1, max_connections=10, max_retries=5, r
                 print("Max retries reached. Could not establish database connection.")
                 raise e
 
+def close_connection_pool():
+    """Close every pooled connection, primary and replicas (worker shutdown)"""
+    global connection_pool, replica_set
+    if connection_pool is not None:
+        connection_pool.closeall()
+        connection_pool = None
+    if replica_set is not None:
+        replica_set.closeall()
+        replica_set = None
+
 def get_connection():
     if connection_pool:
         return connection_pool.getconn()
-    raise Exception("Connection pool not initialized")
+    raise DatabaseNotReadyError("Connection pool not initialized")
 
 def return_connection(connection):
     if connection_pool:
         connection_pool.putconn(connection)
 
-def init_db():
+def acquire_connection():
     """
-    Initialize database tables
-    Multiple vulnerabilities present for learning purposes
+    Return (connection, request_scoped)
+    Inside a Flask request the connection is checked out lazily on first use and
+    kept on `g` until the request is torn down, so every helper called during the
+    request shares one pooled connection. Outside a request a fresh connection
+    is checked out and the caller must hand it back with release_connection().
+    """
+    if not has_request_context():
+        return get_connection(), False
+
+    conn = g.get('_db_connection')
+    if conn is not None and conn.closed:
+        # Connection died mid-request, give the slot back and check out a new one
+        return_connection(g.pop('_db_connection'))
+        conn = None
+    if conn is None:
+        conn = get_connection()
+        g._db_connection = conn
+    return conn, True
+
+def release_connection(connection, request_scoped):
+    if not request_scoped:
+        return_connection(connection)
+
+def release_request_connection(exception=None):
+    """
+    Teardown hook: return the request's connections to their pools (rolls back anything uncommitted)
+    Also called mid-request before slow work that needs no database; the next
+    query checks out a connection again. The read-your-writes pin (_db_wrote)
+    stays for the rest of the request.
+    """
+    for stream in g.pop('_db_streams', ()):
+        # A stream left open (e.g. the client disconnected) must not outlive its connection
+        stream.close()
+    conn = g.pop('_db_connection', None)
+    if conn is not None:
+        return_connection(conn)
+    held = g.pop('_db_replica', None)
+    if held is not None:
+        replica, replica_conn = held
+        replica.putconn(replica_conn)
+
+def init_request_connections(app):
+    """Bind one pooled connection per request to the Flask request lifecycle"""
+    app.teardown_request(release_request_connection)
+
+# Statements that are safe to send to a replica
+_READ_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|FOR\s+UPDATE|FOR\s+SHARE|NEXTVAL)\b', re.IGNORECASE)
+
+def _routes_to_replica(query, fetch=True, primary=False):
+    """
+    Reads go to a replica unless the caller forces the primary (read-your-writes),
+    the statement may write, or this request has already written to the primary
+    """
+    if replica_set is None or primary or not fetch:
+        return False
+    if not _READ_ONLY.match(query) or _WRITES.search(query):
+        return False
+    return not (has_request_context() and g.get('_db_wrote'))
+
+def _note_primary_write():
+    """Pin the rest of the request to the primary so it reads its own writes"""
+    if has_request_context():
+        g._db_wrote = True
+
+def _replica_failed(error, conn):
+    """Connection-level failures take a replica out of rotation; query errors do not"""
+    if conn.closed:
+        return True
+    return isinstance(error, psycopg2.OperationalError) and not isinstance(error, psycopg2.errors.QueryCanceled)
+
+def acquire_replica_connection():
+    """
+    Return (replica, connection, request_scoped) from the replica set
+    Inside a request the replica connection is kept on `g` like the primary one
+    Raises ReplicaUnavailableError when no replica is healthy
     """
+    if not has_request_context():
+        replica, conn = replica_set.getconn()
+        return replica, conn, False
+
+    held = g.get('_db_replica')
+    if held is not None:
+        replica, conn = held
+        if not conn.closed:
+            return replica, conn, True
+        g.pop('_db_replica')
+        replica.putconn(conn, close=True)
+
+    replica, conn = replica_set.getconn()
+    g._db_replica = (replica, conn)
+    return replica, conn, True
+
+def _statement_timeout(timeout_ms, category):
+    if timeout_ms is not None:
+        return int(timeout_ms)
+    return STATEMENT_TIMEOUTS.get(category, STATEMENT_TIMEOUTS['default'])
+
+def _timeout_prefix(timeout_ms):
+    # SET LOCAL lasts until the end of the current transaction and shares the statement's round trip.
+    # A timeout of 0 ("no limit") is still sent: the request's transaction may carry an
+    # earlier statement's shorter timeout. None means the caller has already set it.
+    return f"SET LOCAL statement_timeout = {int(timeout_ms)}; " if timeout_ms is not None else ''
+
+def _run_statement(conn, cursor, query, params, prepare, timeout_ms):
+    if prepare:
+        query, params = prepared_sql(conn, query, params)
+    cursor.execute(_timeout_prefix(timeout_ms) + query, params)
+
+def _execute_on_replica(query, params, prepare, timeout_ms):
+    replica, conn, request_scoped = acquire_replica_connection()
+    try:
+        with conn.cursor() as cursor:
+            _run_statement(conn, cursor, query, params, prepare, timeout_ms)
+            return cursor.fetchall()
+    except Exception as e:
+        if _replica_failed(e, conn):
+            replica.mark_down(e)
+            if request_scoped:
+                g.pop('_db_replica', None)
+            replica.putconn(conn, close=True)
+            raise ReplicaUnavailableError(str(e))
+        conn.rollback()
+        if prepare:
+            _discard_prepared(conn)
+        if not request_scoped:
+            replica.putconn(conn)
+        raise e
+    else:
+        if not request_scoped:
+            replica.putconn(conn)
+
+def get_pool_stats():
+    """Return pool counters (checkouts, in use, waits, timeouts) for monitoring"""
+    if connection_pool is None:
+        return {'mode': None, 'initialized': False}
+    if hasattr(connection_pool, 'stats'):
+        stats = connection_pool.stats()
+    else:
+        stats = {'mode': 'simple', 'max_connections': connection_pool.maxconn}
+    if replica_set is not None:
+        stats['replicas'] = replica_set.stats()
+    return stats
+
+# Literals and placeholders collapse to '?' so one statement shape maps to one fingerprint
+_FINGERPRINT_RULES = [
+    (re.compile(r'--[^\n]*'), ''),
+    (re.compile(r'/\*.*?\*/', re.DOTALL), ''),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\$\d+|%\(\w+\)s|%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),                # IN (?, ?, ?) / VALUES (?, ?)
+    (re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+'), '(?)'),                    # multi-row VALUES
+]
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint_sql(query):
+    """Normalised statement text with comments, literals and parameters stripped"""
+    fingerprint = query
+    for pattern, replacement in _FINGERPRINT_RULES:
+        fingerprint = pattern.sub(replacement, fingerprint)
+    return fingerprint.strip().rstrip(';').strip()
+
+
+class QueryStats:
+    """
+    Per-fingerprint latency, row and pool wait aggregates
+    Bounded to `max_fingerprints` entries; further statements are counted under '<other>'
+    """
+
+    def __init__(self, max_fingerprints=QUERY_STATS_MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, fingerprint, duration, rows=0, pool_wait=0.0, error=False, timed_out=False):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                if len(self._entries) >= self.max_fingerprints:
+                    fingerprint = '<other>'
+                    entry = self._entries.get(fingerprint)
+                if entry is None:
+                    entry = {
+                        'calls': 0,
+                        'errors': 0,
+                        'timeouts': 0,
+                        'rows': 0,
+                        'total_time': 0.0,
+                        'max_time': 0.0,
+                        'pool_wait': 0.0,
+                        'latency': Histogram()
+                    }
+                    self._entries[fingerprint] = entry
+            entry['calls'] += 1
+            entry['rows'] += rows
+            entry['total_time'] += duration
+            entry['max_time'] = max(entry['max_time'], duration)
+            entry['pool_wait'] += pool_wait
+            if error:
+                entry['errors'] += 1
+            if timed_out:
+                entry['timeouts'] += 1
+        entry['latency'].observe(duration)
+
+    def snapshot(self, limit=None):
+        """Entries ordered by total time spent, heaviest first"""
+        with self._lock:
+            items = [(fingerprint, dict(entry)) for fingerprint, entry in self._entries.items()]
+        items.sort(key=lambda item: item[1]['total_time'], reverse=True)
+
+        result = []
+        for fingerprint, entry in items[:limit]:
+            latency = entry.pop('latency')
+            calls = entry['calls']
+            entry.update({
+                'fingerprint': fingerprint,
+                'mean_time': entry['total_time'] / calls if calls else 0.0,
+                'p50': latency.quantile(0.5),
+                'p95': latency.quantile(0.95),
+                'p99': latency.quantile(0.99),
+                'latency_seconds': latency.snapshot()
+            })
+            result.append(entry)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+query_stats = QueryStats()
+_slow_log_lock = threading.Lock()
+# Statements cancelled by statement_timeout, per category
+statement_timeouts = {}
+_timeouts_lock = threading.Lock()
+
+def _take_pool_wait():
+    """Pool wait accumulated by this thread since the last call"""
+    wait = getattr(_pending_wait, 'seconds', 0.0)
+    _pending_wait.seconds = 0.0
+    return wait
+
+def _note_timeout(category):
+    with _timeouts_lock:
+        statement_timeouts[category] = statement_timeouts.get(category, 0) + 1
+
+def _record_query(query, duration, rows, error, wait=0.0, fingerprint=None, category='default'):
+    """
+    Attribute latency, row count and pool wait to the statement's fingerprint
+    error: the exception raised by the statement, if any
+    """
+    fingerprint = fingerprint or fingerprint_sql(query)
+    timed_out = isinstance(error, psycopg2.errors.QueryCanceled)
+    query_stats.record(fingerprint, duration, rows, wait, error is not None, timed_out)
+    if timed_out:
+        _note_timeout(category)
+
+    if duration * 1000 >= SLOW_QUERY_MS:
+        line = (f"[slow query] {datetime.now().isoformat()} {duration * 1000:.1f} ms "
+                f"rows={rows} pool_wait={wait * 1000:.1f} ms error={error is not None} "
+                f"timeout={timed_out} "
+                f"fingerprint={fingerprint} sql={' '.join(query.split())[:1000]}")
+        if SLOW_QUERY_LOG:
+            with _slow_log_lock, open(SLOW_QUERY_LOG, 'a') as log:
+                log.write(line + '\n')
+        else:
+            print(line)
+
+def get_query_stats(limit=None):
+    return query_stats.snapshot(limit)
+
+def get_timeout_stats():
+    """Statement timeout settings and cancellations per category"""
+    with _timeouts_lock:
+        counts = dict(statement_timeouts)
+    return {
+        category: {'timeout_ms': timeout_ms, 'timeouts': counts.get(category, 0)}
+        for category, timeout_ms in STATEMENT_TIMEOUTS.items()
+    }
+
+# Versioned schema migrations: migrations/NNNN_name.sql, applied once in order
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_ID = 7201  # pg_advisory_xact_lock key so concurrent workers migrate one at a time
+
+def load_migrations():
+    """Return [(version, name, path)] for every migration script, ordered by version"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+def _current_schema_version(cursor):
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+def get_schema_version():
+    """Highest applied migration version (0 for an empty database)"""
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            # Create users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username TEXT NOT NULL UNIQUE,
-                    password TEXT NOT NULL,  -- Vulnerability: Passwords stored in plaintext
-                    account_number TEXT NOT NULL UNIQUE,
-                    balance DECIMAL(15, 2) DEFAULT 1000.0,
-                    is_admin BOOLEAN DEFAULT FALSE,
-                    profile_picture TEXT,
-                    reset_pin TEXT  -- Vulnerability: Reset PINs stored in plaintext
-                )
-            ''')
-            
-            # Create loans table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS loans (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    amount DECIMAL(15, 2),
-                    status TEXT DEFAULT 'pending'
-                )
-            ''')
-            
-            # Create transactions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id SERIAL PRIMARY KEY,
-                    from_account TEXT NOT NULL,
-                    to_account TEXT NOT NULL,
-                    amount DECIMAL(15, 2) NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    transaction_type TEXT NOT NULL,
-                    description TEXT
-                )
-            ''')
-            
-            # Create virtual cards table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS virtual_cards (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    card_number TEXT NOT NULL UNIQUE,  -- Vulnerability: Card numbers stored in plaintext
-                    cvv TEXT NOT NULL,  -- Vulnerability: CVV stored in plaintext
-                    expiry_date TEXT NOT NULL,
-                    card_limit DECIMAL(15, 2) DEFAULT 1000.0,
-                    current_balance DECIMAL(15, 2) DEFAULT 0.0,
-                    is_frozen BOOLEAN DEFAULT FALSE,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used_at TIMESTAMP,
-                    card_type TEXT DEFAULT 'standard'  -- Vulnerability: No validation on card type
-                )
-            ''')
+            return _current_schema_version(cursor)
+    finally:
+        return_connection(conn)
 
-            # Create virtual card transactions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS card_transactions (
-                    id SERIAL PRIMARY KEY,
-                    card_id INTEGER REFERENCES virtual_cards(id) ON DELETE CASCADE,
-                    amount DECIMAL(15, 2) NOT NULL,
-                    merchant_name TEXT,  -- Vulnerability: No input validation
-                    transaction_type TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    description TEXT
-                )
-            ''')
-            
-            # Create default admin account if it doesn't exist
-            cursor.execute("SELECT * FROM users WHERE username='admin'")
-            if not cursor.fetchone():
-                cursor.execute(
-                    """
-                    INSERT INTO users (username, password, account_number, balance, is_admin) 
-                    VALUES (%s, %s, %s, %s, %s)
-                    """,
-                    ('admin', 'admin123', 'ADMIN001', 1000000.0, True)
-                )
-            
-            # Create bill categories table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS bill_categories (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL UNIQUE,
-                    description TEXT,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            ''')
+def schema_is_current():
+    return get_schema_version() >= load_migrations()[-1][0]
+
+def run_migrations():
+    """
+    Apply pending migrations in a single transaction
+    When the schema is already current this is two cheap catalog reads and no DDL
+    """
+    migrations = load_migrations()
+    latest = migrations[-1][0]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            if _current_schema_version(cursor) >= latest:
+                conn.rollback()
+                print(f"Database schema is current (version {latest})")
+                return
 
-            # Create billers table
+            # Serialise migrators, then re-read what has been applied under the lock
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS billers (
-                    id SERIAL PRIMARY KEY,
-                    category_id INTEGER REFERENCES bill_categories(id),
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
                     name TEXT NOT NULL,
-                    account_number TEXT NOT NULL,  -- Vulnerability: No encryption
-                    description TEXT,
-                    minimum_amount DECIMAL(15, 2) DEFAULT 0,
-                    maximum_amount DECIMAL(15, 2),  -- Vulnerability: No validation
-                    is_active BOOLEAN DEFAULT TRUE
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cursor.fetchall()}
 
-            # Create bill payments table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS bill_payments (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    biller_id INTEGER REFERENCES billers(id),
-                    amount DECIMAL(15, 2) NOT NULL,
-                    payment_method TEXT NOT NULL,  -- 'balance' or 'virtual_card'
-                    card_id INTEGER REFERENCES virtual_cards(id),  -- NULL if paid with balance
-                    reference_number TEXT,  -- Vulnerability: No unique constraint
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    processed_at TIMESTAMP,
-                    description TEXT
+            for version, name, path in migrations:
+                if version in applied:
+                    continue
+                with open(path) as script:
+                    cursor.execute(script.read())
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name)
                 )
-            ''')
+                print(f"Applied migration {version:04d}_{name}")
 
-            # Insert default bill categories
-            cursor.execute("""
-                INSERT INTO bill_categories (name, description) 
-                VALUES 
-                ('Utilities', 'Water, Electricity, Gas bills'),
-                ('Telecommunications', 'Phone, Internet, Cable TV'),
-                ('Insurance', 'Life, Health, Auto insurance'),
-                ('Credit Cards', 'Credit card bill payments')
-                ON CONFLICT (name) DO NOTHING
-            """)
-
-            # Insert sample billers
-            cursor.execute("""
-                INSERT INTO billers (category_id, name, account_number, description, minimum_amount) 
-                VALUES 
-                (1, 'City Water', 'WATER001', 'City Water Utility', 10),
-                (1, 'PowerGen Electric', 'POWER001', 'Electricity Provider', 20),
-                (2, 'TeleCom Services', 'TEL001', 'Phone and Internet', 25),
-                (2, 'CableTV Plus', 'CABLE001', 'Cable TV Services', 30),
-                (3, 'HealthFirst Insurance', 'INS001', 'Health Insurance', 100),
-                (4, 'Universal Bank Card', 'CC001', 'Credit Card Payments', 50)
-                ON CONFLICT DO NOTHING
-            """)
-            
             conn.commit()
-            print("Database initialized successfully")
-            
+            print(f"Database schema migrated to version {latest}")
+
     except Exception as e:
         # Vulnerability: Detailed error information exposed
-        print(f"Error initializing database: {e}")
+        print(f"Error migrating database: {e}")
         conn.rollback()
         raise e
     finally:
         return_connection(conn)
 
-def execute_query(query, params=None, fetch=True):
+def init_db():
+    """
+    Initialize database tables
+    Brings the schema up to date via run_migrations(); a no-op when already current
+    """
+    run_migrations()
+
+# Progress of start_background_init(), reported by /readyz
+startup_state = {
+    'state': 'not_started',  # not_started, connecting, migrating, ready
+    'attempts': 0,
+    'last_error': None,
+    'started_at': None,
+    'ready_at': None
+}
+_startup_lock = threading.Lock()
+_startup_pid = None
+
+def start_background_init():
+    """
+    Create the connection pool and bring the schema up to date on a daemon thread
+    Returns immediately so the process can serve /healthz while the database
+    comes up; attempts are retried with capped exponential backoff until they
+    succeed. Safe to call again after fork: each process runs its own init once.
+    """
+    global _startup_pid
+    with _startup_lock:
+        if _startup_pid == os.getpid():
+            return
+        _startup_pid = os.getpid()
+        startup_state.update(state='connecting', attempts=0, last_error=None,
+                             started_at=time.time(), ready_at=None)
+    threading.Thread(target=_background_init, name='db-init', daemon=True).start()
+
+def _background_init():
+    delay = INIT_RETRY_DELAY
+    while True:
+        startup_state['attempts'] += 1
+        try:
+            if connection_pool is None:
+                startup_state['state'] = 'connecting'
+                init_connection_pool(max_retries=1)
+            startup_state['state'] = 'migrating'
+            run_migrations()
+            startup_state.update(state='ready', last_error=None, ready_at=time.time())
+            print(f"Database ready after {startup_state['ready_at'] - startup_state['started_at']:.2f}s")
+            return
+        except Exception as e:
+            # Vulnerability: Detailed error information exposed via /readyz
+            startup_state['last_error'] = str(e)
+            print(f"Database not ready (attempt {startup_state['attempts']}), retrying in {delay:.2f}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, INIT_MAX_RETRY_DELAY)
+
+def is_database_ready():
+    """True once this process has a connection pool and a current schema"""
+    return startup_state['state'] == 'ready' and connection_pool is not None
+
+def get_readiness():
+    """Startup progress for the readiness probe"""
+    state = dict(startup_state)
+    state['ready'] = is_database_ready()
+    return state
+
+def _to_positional(query):
+    """
+    Rewrite psycopg2 %s placeholders as $1..$n for PREPARE
+    Escaped %% is kept because the combined PREPARE/EXECUTE text is still formatted by psycopg2
+    """
+    counter = itertools.count(1)
+    return re.sub(r'%[s%]', lambda m: m.group() if m.group() == '%%' else f"${next(counter)}", query)
+
+def prepared_sql(conn, query, params=None):
+    """
+    Return (sql, params) that run `query` through the connection's prepared statement cache
+    First use sends PREPARE and EXECUTE in the same round trip; later uses only EXECUTE,
+    so Postgres skips parsing and (after a few runs) planning. The least recently used
+    statement is DEALLOCATEd once the cache exceeds DB_PREPARED_CACHE_SIZE.
+    Queries with named (%(name)s) parameters, and connections without a cache, run unprepared.
+    """
+    cache = getattr(conn, 'prepared_statements', None)
+    if cache is None or PREPARED_CACHE_SIZE <= 0 or '%(' in query:
+        return query, params
+
+    params = tuple(params or ())
+    prefix = ''
+    name = cache.get(query)
+    if name is None:
+        name = f"ps_{next(conn.prepared_ids)}"
+        # Without parameters psycopg2 leaves % untouched, so the text is used verbatim
+        body = query.strip().rstrip(';')
+        prefix = f"PREPARE {name} AS {_to_positional(body) if params else body}; "
+        cache[query] = name
+        if len(cache) > PREPARED_CACHE_SIZE:
+            _, evicted = cache.popitem(last=False)
+            prefix = f"DEALLOCATE {evicted}; " + prefix
+    else:
+        cache.move_to_end(query)
+
+    if not params:
+        return f"{prefix}EXECUTE {name}", None
+    return f"{prefix}EXECUTE {name}({', '.join(['%s'] * len(params))})", params
+
+def _discard_prepared(conn):
+    """After an error the cache may not match the server, so start over"""
+    cache = getattr(conn, 'prepared_statements', None)
+    if not cache or conn.closed:
+        return
+    cache.clear()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DEALLOCATE ALL")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+
+def execute_query(query, params=None, fetch=True, prepare=False, primary=False,
+                  category='default', timeout_ms=None):
     """
     Execute a database query
+    prepare: run through the per-connection prepared statement cache (for fixed, hot queries)
+    primary: never route to a read replica (read-your-writes, check-then-act)
+    category / timeout_ms: server-side statement timeout, from STATEMENT_TIMEOUTS unless given
+    explicitly; a cancelled statement raises QueryTimeoutError
+    Latency, rows and pool wait are recorded in query_stats under the statement's fingerprint
     Vulnerability: This function still allows for SQL injection if called with string formatting
     """
-    conn = get_connection()
+    timeout_ms = _statement_timeout(timeout_ms, category)
+    _take_pool_wait()
+    started = time.perf_counter()
+    result = None
+    error = None
+    try:
+        result = _execute_query(query, params, fetch, prepare, primary, timeout_ms)
+        return result
+    except psycopg2.errors.QueryCanceled as e:
+        error = e
+        raise _timeout_error(
+            f"Query cancelled after {timeout_ms} ms ({category}): {e}", category, timeout_ms
+        ) from e
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        wait = _take_pool_wait()
+        _record_query(query, max(time.perf_counter() - started - wait, 0.0),
+                      len(result) if result else 0, error, wait, category=category)
+
+def _execute_query(query, params, fetch, prepare, primary, timeout_ms):
+    if _routes_to_replica(query, fetch, primary):
+        try:
+            return _execute_on_replica(query, params, prepare, timeout_ms)
+        except ReplicaUnavailableError:
+            pass  # Fall back to the primary
+
+    conn, request_scoped = acquire_connection()
     try:
         with conn.cursor() as cursor:
-            cursor.execute(query, params)
+            _run_statement(conn, cursor, query, params, prepare, timeout_ms)
             result = None
             if fetch:
                 result = cursor.fetchall()
             # Always commit for INSERT, UPDATE, DELETE operations
             if query.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
                 conn.commit()
+                _note_primary_write()
             return result
     except Exception as e:
         # Vulnerability: Error details might be exposed to users
         conn.rollback()
+        if prepare:
+            _discard_prepared(conn)
         raise e
     finally:
-        return_connection(conn)
+        release_connection(conn, request_scoped)
 
-def execute_transaction(queries_and_params):
+# Single-row "INSERT ... VALUES (%s, ...)" statements that can be merged into one multi-row INSERT
+_INSERT_VALUES = re.compile(r'^(\s*INSERT\s.*?\bVALUES\s*)(\((?:\s*%s\s*,)*\s*%s\s*\))\s*;?\s*$', re.IGNORECASE | re.DOTALL)
+
+def _merge_inserts(queries_and_params):
+    """
+    Group consecutive identical single-row INSERTs (execute_values style)
+    Yields (query, params, rows) where rows is a list of parameter tuples for a
+    merged INSERT and None for a statement that runs as-is
+    """
+    pending_query, pending_rows = None, []
+    for query, params in queries_and_params:
+        if pending_query is not None and query == pending_query:
+            pending_rows.append(params)
+            continue
+        if pending_query is not None:
+            yield pending_query, None, pending_rows
+            pending_query, pending_rows = None, []
+        if _INSERT_VALUES.match(query):
+            pending_query, pending_rows = query, [params]
+        else:
+            yield query, params, None
+    if pending_query is not None:
+        yield pending_query, None, pending_rows
+
+def _render_batch(conn, cursor, queries_and_params, prepare):
+    """Render every statement client-side so the whole transaction can go out as one query string"""
+    statements = []
+    for query, params, rows in _merge_inserts(queries_and_params):
+        if rows is not None and len(rows) > 1:
+            head, row_template = _INSERT_VALUES.match(query).groups()
+            values = ', '.join(cursor.mogrify(row_template, row).decode() for row in rows)
+            statements.append(head + values)
+            continue
+        if rows is not None:
+            params = rows[0]
+        if prepare:
+            query, params = prepared_sql(conn, query, params)
+        statements.append(cursor.mogrify(query, params).decode())
+    return statements
+
+def execute_transaction(queries_and_params, prepare=False, batch=True, category='default', timeout_ms=None):
     """
     Execute multiple queries in a transaction
     Vulnerability: No input validation on queries
     queries_and_params: list of tuples (query, params)
+    prepare: run every statement through the prepared statement cache
+    batch: send all statements in a single round trip. Consecutive identical
+           single-row INSERTs are merged into one multi-row INSERT. Either
+           everything commits or nothing does, as with batch=False.
+    category / timeout_ms: statement timeout applied to every statement (see execute_query)
+    The transaction is recorded in query_stats as one entry keyed by its statement fingerprints
     """
-    conn = get_connection()
+    queries_and_params = list(queries_and_params)
+    timeout_ms = _statement_timeout(timeout_ms, category)
+    _take_pool_wait()
+    started = time.perf_counter()
+    error = None
+    try:
+        _execute_transaction(queries_and_params, prepare, batch, timeout_ms)
+    except psycopg2.errors.QueryCanceled as e:
+        error = e
+        raise _timeout_error(
+            f"Transaction cancelled after {timeout_ms} ms ({category}): {e}", category, timeout_ms
+        ) from e
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        fingerprints = []
+        for query, _ in queries_and_params:
+            fingerprint = fingerprint_sql(query)
+            if not fingerprints or fingerprints[-1] != fingerprint:
+                fingerprints.append(fingerprint)
+        wait = _take_pool_wait()
+        _record_query(
+            '; '.join(query for query, _ in queries_and_params),
+            max(time.perf_counter() - started - wait, 0.0), 0, error, wait,
+            fingerprint='TRANSACTION: ' + '; '.join(fingerprints), category=category
+        )
+
+def _execute_transaction(queries_and_params, prepare, batch, timeout_ms):
+    conn, request_scoped = acquire_connection()
     try:
         with conn.cursor() as cursor:
-            for query, params in queries_and_params:
-                cursor.execute(query, params)
-            conn.commit()
+            if not batch:
+                if timeout_ms is not None:
+                    cursor.execute(_timeout_prefix(timeout_ms))
+                for query, params in queries_and_params:
+                    _run_statement(conn, cursor, query, params, prepare, None)
+                conn.commit()
+                _note_primary_write()
+                return
+
+            statements = _render_batch(conn, cursor, queries_and_params, prepare)
+            if not statements:
+                return
+            if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                # BEGIN ... COMMIT inside one simple query: one round trip for the whole transaction
+                conn.autocommit = True
+                try:
+                    cursor.execute('BEGIN; ' + _timeout_prefix(timeout_ms) + '; '.join(statements) + '; COMMIT')
+                except Exception:
+                    # A failed statement leaves the explicit block open and aborted
+                    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        cursor.execute('ROLLBACK')
+                    raise
+                finally:
+                    conn.autocommit = False
+            else:
+                # Already inside the request's transaction: one round trip plus COMMIT
+                cursor.execute(_timeout_prefix(timeout_ms) + '; '.join(statements))
+                conn.commit()
+            _note_primary_write()
     except Exception as e:
         # Vulnerability: Transaction rollback exposed
         conn.rollback()
+        if prepare:
+            _discard_prepared(conn)
         raise e
     finally:
-        return_connection(conn)
\ No newline at end of file
+        release_connection(conn, request_scoped)
+
+def stream_query(query, params=None, fetch_size=None, primary=False, category='default', timeout_ms=None):
+    """
+    Execute a SELECT on a named server-side cursor and return a StreamedRows iterator
+    Rows are fetched from Postgres `fetch_size` at a time, so memory stays flat
+    regardless of the result size. The query is declared immediately (errors are
+    raised here), rows are pulled as the iterator is consumed, and the cursor's
+    transaction ends once the rows are exhausted or close() is called.
+    Inside a request the cursor runs on the request's own connection (see
+    acquire_connection), so a request never holds two pooled connections; the
+    request must not write through that connection while the stream is open.
+    Outside a request a dedicated connection is checked out and returned on close.
+    Reads go to a replica when configured unless `primary` is set.
+    The statement timeout applies to the DECLARE and to each FETCH; a timeout
+    raises QueryTimeoutError here or while iterating.
+    Vulnerability: Same SQL injection exposure as execute_query
+    """
+    timeout_ms = _statement_timeout(timeout_ms, category)
+    _take_pool_wait()
+    if _routes_to_replica(query, True, primary):
+        try:
+            replica, conn, request_scoped = acquire_replica_connection()
+        except ReplicaUnavailableError:
+            pass  # Fall back to the primary
+        else:
+            release = _end_stream_transaction if request_scoped else replica.putconn
+            try:
+                return _track_stream(_open_stream(conn, query, params, fetch_size, release, category, timeout_ms),
+                                     request_scoped)
+            except Exception as e:
+                if not _replica_failed(e, conn):
+                    raise e
+                replica.mark_down(e)
+                if request_scoped:
+                    g.pop('_db_replica', None)
+                    replica.putconn(conn, close=True)
+
+    conn, request_scoped = acquire_connection()
+    release = _end_stream_transaction if request_scoped else return_connection
+    return _track_stream(_open_stream(conn, query, params, fetch_size, release, category, timeout_ms),
+                         request_scoped)
+
+def _end_stream_transaction(conn):
+    """Release for streams on a request's connection: end the cursor's transaction, keep the connection"""
+    if conn.closed:
+        return
+    if has_request_context() and any(
+            stream._conn is conn and not stream.closed for stream in g.get('_db_streams', ())):
+        return  # Another open stream still reads in this transaction
+    conn.rollback()
+
+def _track_stream(rows, request_scoped):
+    """Remember request-scoped streams so teardown closes them before their connection goes back"""
+    if request_scoped:
+        g.setdefault('_db_streams', []).append(rows)
+    return rows
+
+def _open_stream(conn, query, params, fetch_size, release, category, timeout_ms):
+    cursor = None
+    try:
+        if timeout_ms is not None:
+            # DECLARE cannot carry a second statement, so the timeout costs one extra round trip
+            with conn.cursor() as setup:
+                setup.execute(_timeout_prefix(timeout_ms))
+        cursor = conn.cursor(name=f"stream_{next(_stream_cursor_ids)}")
+        cursor.itersize = fetch_size or STREAM_FETCH_SIZE
+        cursor.execute(query, params)
+    except Exception as e:
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        if not conn.closed:
+            conn.rollback()
+        release(conn)
+        if isinstance(e, psycopg2.errors.QueryCanceled):
+            _note_timeout(category)
+            raise _timeout_error(
+                f"Query cancelled after {timeout_ms} ms ({category}): {e}", category, timeout_ms
+            ) from e
+        raise e
+    return StreamedRows(conn, cursor, release, query, category, timeout_ms)
+
+class StreamedRows:
+    """Row iterator over a server-side cursor; `release` hands its connection back on close"""
+
+    def __init__(self, conn, cursor, release=None, query=None, category='default', timeout_ms=None):
+        self._conn = conn
+        self._cursor = cursor
+        self._release = release or return_connection
+        self._query = query
+        self.category = category
+        self.timeout_ms = timeout_ms
+        self._wait = _take_pool_wait()
+        self._started = time.perf_counter()
+        self._error = None
+        self.rows_read = 0
+        self._rows = iter(cursor)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        try:
+            row = next(self._rows)
+        except StopIteration:
+            self.close()
+            raise
+        except psycopg2.errors.QueryCanceled as e:
+            self._error = e
+            self.close()
+            raise _timeout_error(
+                f"Query cancelled after {self.timeout_ms} ms ({self.category}): {e}", self.category, self.timeout_ms
+            ) from e
+        except BaseException as e:
+            # Failed mid-stream, the connection goes back now
+            self._error = e
+            self.close()
+            raise
+        self.rows_read += 1
+        return row
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._cursor.close()
+        except Exception:
+            pass
+        # putconn rolls back the read-only transaction holding the cursor
+        self._release(self._conn)
+        if self._query is not None:
+            # Covers the whole stream, including time spent by the consumer between fetches
+            _record_query(self._query, time.perf_counter() - self._started,
+                          self.rows_read, self._error, self._wait, category=self.category)
+
+    def __del__(self):
+        self.close()
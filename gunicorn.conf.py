@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for the production server (see wsgi.py)
+Every value can be overridden through the environment
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Each worker holds its own connection pool of up to DB_POOL_MAX connections,
+# so workers * DB_POOL_MAX must stay below Postgres max_connections.
+# Threads beyond the pool size just queue for a connection.
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+
+# Import the app once in the master and fork workers from it
+preload_app = True
+
+# Recycle workers periodically; the jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# Long enough for the admin statement timeout and streamed exports
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Worker heartbeat files live on tmpfs: the default (/tmp) is not writable in
+# the hardened Deployment (readOnlyRootFilesystem) and a disk-backed file can
+# stall the heartbeat
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm')
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    from wsgi import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from wsgi import shutdown_worker
+    shutdown_worker()
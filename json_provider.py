@@ -0,0 +1,59 @@
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the stdlib encoder
+    orjson = None
+
+# orjson output that matches what the stdlib path produces: non-str keys
+# allowed, datetimes handed to default() so they keep the str() format
+ORJSON_OPTIONS = 0
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONEncoder(JSONEncoder):
+    """
+    JSON encoder for API responses, installed as app.json_encoder
+    Serialises database values directly: DECIMAL columns become floats and
+    timestamps keep their str() form ('2024-01-01 12:00:00'), so views can
+    hand query rows to jsonify without converting each field. psycopg2 rows
+    are tuples and encode as arrays.
+
+    When orjson is installed it does the encoding and this class only
+    supplies default(); anything orjson rejects (e.g. integers wider than
+    64 bits) goes through the stdlib encoder instead. orjson writes non-ASCII
+    characters as UTF-8 rather than \\u escapes.
+    """
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if isinstance(o, (datetime, date, dt_time)):
+            return str(o)
+        return super().default(o)
+
+    def encode(self, o):
+        if orjson is not None and self._orjson_compatible():
+            options = ORJSON_OPTIONS
+            if self.sort_keys:
+                options |= orjson.OPT_SORT_KEYS
+            if self.indent:
+                options |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(o, default=self.default, option=options).decode()
+            except TypeError:
+                pass
+        return super().encode(o)
+
+    def _orjson_compatible(self):
+        """orjson only indents by two spaces and has no skipkeys"""
+        return self.indent in (None, 2) and not self.skipkeys
+
+
+def init_json(app):
+    """Use FastJSONEncoder for jsonify() and flask.json.dumps() within this app"""
+    app.json_encoder = FastJSONEncoder
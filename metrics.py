@@ -0,0 +1,255 @@
+import bisect
+import threading
+import time
+
+# Default latency buckets in seconds (upper bounds, +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram
+    Observing a value is a bisect plus two additions under a lock
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """Approximate quantile: upper bound of the bucket holding the q-th observation"""
+        with self._lock:
+            counts = list(self._counts)
+            count = self._count
+        if count == 0:
+            return None
+        rank = q * count
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            if running >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        """Return cumulative bucket counts, sum and count"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+            count = self._count
+
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+
+        return {
+            'buckets': cumulative,
+            'sum': total,
+            'count': count
+        }
+
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    """
+    One metric family: a name, help text and label names
+    Samples are either recorded into the metric as they happen, or read from
+    `callback` at scrape time (an iterable of (label values, value) pairs) for
+    numbers something else already keeps, such as pool and cache counters.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        if self.callback is not None:
+            return list(self.callback())
+        with self._lock:
+            return list(self._values.items())
+
+
+class Counter(Metric):
+    """Monotonic total, one per combination of label values"""
+
+    type = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    type = 'gauge'
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class HistogramMetric(Metric):
+    """
+    A Histogram per combination of label values
+    Callbacks return Histogram.snapshot() dicts instead of plain numbers
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, callback)
+        self.buckets = buckets
+
+    def observe(self, value, *labelvalues):
+        histogram = self._values.get(labelvalues)
+        if histogram is None:
+            with self._lock:
+                histogram = self._values.setdefault(labelvalues, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def samples(self):
+        if self.callback is not None:
+            return list(self.callback())
+        with self._lock:
+            children = list(self._values.items())
+        return [(labelvalues, histogram.snapshot()) for labelvalues, histogram in children]
+
+
+class Registry:
+    """Metric families rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), callback=None, buckets=DEFAULT_BUCKETS):
+        return self.register(HistogramMetric(name, documentation, labelnames, callback, buckets))
+
+    def render(self):
+        """Every family in text exposition format; a failing callback drops only its family"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"Metrics collection failed for {metric.name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labelvalues, value in samples:
+                labels = list(zip(metric.labelnames, labelvalues))
+                if metric.type == 'histogram':
+                    for bound, count in value['buckets']:
+                        lines.append(_sample(f"{metric.name}_bucket", labels + [('le', bound)], count))
+                    lines.append(_sample(f"{metric.name}_sum", labels, value['sum']))
+                    lines.append(_sample(f"{metric.name}_count", labels, value['count']))
+                elif value is not None:
+                    lines.append(_sample(metric.name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    return repr(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return f"{name} {_format_value(value)}"
+    rendered = ','.join(
+        f'{label}="{_format_value(v) if label == "le" else _escape_label(v)}"' for label, v in labels
+    )
+    return f"{name}{{{rendered}}} {_format_value(value)}"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    'vulnbank_http_request_duration_seconds',
+    'Time from the start of the request to the response headers, by route',
+    ('method', 'endpoint')
+)
+http_requests = registry.counter(
+    'vulnbank_http_requests_total',
+    'Responses sent, by route and status code',
+    ('method', 'endpoint', 'status')
+)
+
+
+def init_request_metrics(app):
+    """
+    Time every request from before_request to after_request
+    Routes are labelled by their URL rule (not the raw path) so label
+    cardinality stays bounded; unmatched paths share one label. For streamed
+    responses the duration covers the view and the response headers only.
+    """
+    from flask import g, request
+
+    def start_timer():
+        g._request_started = time.perf_counter()
+
+    def record_request(response):
+        started = g.pop('_request_started', None)
+        if started is not None:
+            rule = request.url_rule
+            endpoint = rule.rule if rule is not None else '<unmatched>'
+            http_request_duration.observe(time.perf_counter() - started, request.method, endpoint)
+            http_requests.inc(request.method, endpoint, str(response.status_code))
+        return response
+
+    # Runs before the other before_request hooks so their time is counted
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+    app.after_request(record_request)
@@ -0,0 +1,21 @@
+-- Secondary indexes for the hot lookups and keyset-paginated history queries
+
+-- Account history: WHERE from_account = ? OR to_account = ? ORDER BY timestamp DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_transactions_from_account_ts ON transactions (from_account, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_to_account_ts ON transactions (to_account, timestamp DESC, id DESC);
+
+-- Recent transactions across all accounts (AI agent context)
+CREATE INDEX IF NOT EXISTS idx_transactions_ts ON transactions (timestamp DESC);
+
+-- Bill payment history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_bill_payments_user_created ON bill_payments (user_id, created_at DESC, id DESC);
+
+-- Card history: WHERE card_id = ? ORDER BY timestamp DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_card_transactions_card_ts ON card_transactions (card_id, timestamp DESC, id DESC);
+
+-- Cards owned by a user
+CREATE INDEX IF NOT EXISTS idx_virtual_cards_user ON virtual_cards (user_id);
+
+-- Loans: admin panel lists pending loans, dashboard lists a user's loans
+CREATE INDEX IF NOT EXISTS idx_loans_pending ON loans (id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_loans_user ON loans (user_id);
@@ -0,0 +1,14 @@
+-- Shared rate limit counters for the postgres rate limit backend
+-- One row per (limiter:key, window bucket); expires_at is when the bucket leaves its window
+
+CREATE TABLE IF NOT EXISTS rate_limit_counters (
+    key TEXT NOT NULL,
+    bucket BIGINT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    expires_at DOUBLE PRECISION NOT NULL,  -- epoch seconds
+    PRIMARY KEY (key, bucket)
+);
+
+-- Expiry sweeps across all limiters
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_expires_at
+    ON rate_limit_counters (expires_at);
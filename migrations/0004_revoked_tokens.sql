@@ -0,0 +1,10 @@
+-- Revoked JWT ids (the token's jti claim); checked behind an in-process Bloom filter
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti TEXT PRIMARY KEY,
+    user_id INTEGER,
+    revoked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Workers pull revocations made elsewhere by revoked_at
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens (revoked_at);
@@ -0,0 +1,91 @@
+import base64
+import json
+import os
+from datetime import datetime
+from flask import request
+
+# Keyset pagination on (timestamp, id) for history endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE_DEFAULT', '50'))
+MAX_PAGE_SIZE = int(os.getenv('PAGE_SIZE_MAX', '500'))
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor pointing just past the row with this (timestamp, id)"""
+    raw = json.dumps([timestamp.isoformat(), int(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (datetime, id) or raise ValueError for a malformed cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def get_page_args():
+    """
+    Read `limit` and `cursor` from the query string
+    Returns (limit, position) where position is None for the first page
+    Raises ValueError on bad input
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = request.args.get('cursor')
+    position = decode_cursor(cursor) if cursor else None
+    return limit, position
+
+
+def keyset_condition(timestamp_column, id_column, position):
+    """
+    SQL fragment restricting rows to those after `position` in DESC order
+    Rows with a NULL timestamp are left out on every page: they have no
+    position to encode in a cursor (and sort first in DESC order).
+    position values come from decode_cursor (a datetime and an int), so they
+    are safe to inline and the surrounding query keeps its existing style
+    """
+    condition = f"AND {timestamp_column} IS NOT NULL"
+    if position is None:
+        return condition
+    timestamp, row_id = position
+    return f"{condition} AND ({timestamp_column}, {id_column}) < ('{timestamp.isoformat()}'::timestamp, {int(row_id)})"
+
+
+class KeysetPage:
+    """
+    Wraps rows fetched with LIMIT page_size + 1
+    Yields at most `limit` rows; once iterated, `next_cursor` is set when more rows exist
+    key: callable returning (timestamp, id) for a row
+    """
+
+    def __init__(self, rows, limit, key):
+        self.rows = rows
+        self.limit = limit
+        self.key = key
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        try:
+            for count, row in enumerate(self.rows):
+                if count == self.limit:
+                    self.next_cursor = encode_cursor(*self.key(last))
+                    break
+                last = row
+                yield row
+        finally:
+            # Release a streaming cursor early once the extra row has been seen
+            self.close()
+
+    def close(self):
+        close = getattr(self.rows, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,61 @@
+"""
+Build step: write gzip and brotli variants of the static assets
+
+    python precompress_static.py [static_dir]
+
+For every compressible file of at least COMPRESSION_MIN_SIZE bytes this
+writes `<file>.gz` (and `<file>.br` when the brotli module is installed) at
+maximum compression. compression.init_compression() serves these with a
+matching Content-Encoding instead of compressing on every request. User
+uploads are skipped since they change at runtime.
+"""
+import gzip
+import mimetypes
+import os
+import sys
+
+from compression import COMPRESSIBLE_TYPES, COMPRESSION_MIN_SIZE, brotli
+
+SKIP_DIRS = {'uploads'}
+SKIP_SUFFIXES = ('.gz', '.br')
+
+
+def precompress(path):
+    """Write the compressed variants of one file; returns {suffix: size}"""
+    with open(path, 'rb') as source:
+        data = source.read()
+    # mtime=0 keeps the .gz bytes identical across builds
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+
+    written = {}
+    for suffix, compressed in variants.items():
+        if len(compressed) >= len(data):
+            continue  # Not worth a Content-Encoding
+        with open(path + suffix, 'wb') as target:
+            target.write(compressed)
+        written[suffix] = len(compressed)
+    return written
+
+
+def main():
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    if brotli is None:
+        print("brotli is not installed; writing gzip variants only")
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = [d for d in subdirs if d not in SKIP_DIRS]
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if name.endswith(SKIP_SUFFIXES) or mimetypes.guess_type(name)[0] not in COMPRESSIBLE_TYPES:
+                continue
+            size = os.path.getsize(path)
+            if size < COMPRESSION_MIN_SIZE:
+                continue
+            written = precompress(path)
+            sizes = ', '.join(f"{suffix} {length}" for suffix, length in written.items())
+            print(f"{os.path.relpath(path, root)}: {size} -> {sizes or 'skipped'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,765 @@
+import fnmatch
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import database
+from flask import g, jsonify, request
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+# Number of buckets a window is split into; a key's count is exact to one bucket width
+RATE_LIMIT_BUCKETS = int(os.getenv('RATE_LIMIT_BUCKETS', '60'))
+
+# Where counters live: memory (per process), shm (shared by the workers on one host)
+# or postgres (shared by every replica)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_SHM_DIR = os.getenv('RATE_LIMIT_SHM_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+# Table slots (distinct live keys) per shm limiter. A slot takes 20 + 4 * buckets
+# bytes rounded up to 8: 264 B at 60 buckets, 64 B for a burst limiter. The
+# defaults come to about 30 MiB for the AI limiter plus five route policies,
+# within the 64 MiB /dev/shm Docker and Kubernetes give a container; larger
+# settings need a bigger shm_size or an emptyDir with medium: Memory.
+RATE_LIMIT_SHM_SLOTS = int(os.getenv('RATE_LIMIT_SHM_SLOTS', '65536'))
+# Route policies (and their burst limiters) key on client IPs for short windows
+RATE_LIMIT_SHM_ROUTE_SLOTS = int(os.getenv('RATE_LIMIT_SHM_ROUTE_SLOTS', '8192'))
+
+# Hard cap on keys held by the memory backend; the least recently hit key is evicted beyond it
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+# Seconds between background expiry sweeps (0 disables the sweeper)
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv('RATE_LIMIT_SWEEP_INTERVAL', '60'))
+# Keys expired per lock hold during a sweep, so checks are never blocked for long
+SWEEP_CHUNK = 1000
+# Resolution of the one-second burst window
+BURST_BUCKETS = 10
+
+_sweeper_lock = threading.Lock()
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'count', 'limit', 'reset_after'])
+
+
+class _Window:
+    """Non-empty buckets of one key as [bucket_index, count] pairs, oldest first, plus their total"""
+
+    __slots__ = ('buckets', 'total')
+
+    def __init__(self):
+        self.buckets = []
+        self.total = 0
+
+    def advance(self, oldest):
+        # Each bucket is appended once and dropped once, so this is amortised O(1)
+        buckets = self.buckets
+        while buckets and buckets[0][0] < oldest:
+            self.total -= buckets.pop(0)[1]
+
+    def add(self, index, cost):
+        if self.buckets and self.buckets[-1][0] == index:
+            self.buckets[-1][1] += cost
+        else:
+            self.buckets.append([index, cost])
+        self.total += cost
+
+    @property
+    def last(self):
+        return self.buckets[-1][0] if self.buckets else None
+
+
+class RateLimiter:
+    """
+    Rate limit backend interface
+    hit() counts a request unless it would exceed the limit, peek() reads the
+    count without recording anything; both return a RateLimitResult
+    """
+
+    backend = None
+
+    def __init__(self, name, window, buckets=RATE_LIMIT_BUCKETS):
+        self.name = name
+        self.window = window
+        self.buckets = max(1, int(buckets))
+        self.bucket_width = window / self.buckets
+        self.expired = 0
+        self._sweeper_pid = None
+
+    def hit(self, key, limit, cost=1, now=None):
+        raise NotImplementedError
+
+    def peek(self, key, limit, now=None):
+        raise NotImplementedError
+
+    def reset(self, key):
+        raise NotImplementedError
+
+    def sweep(self, now=None):
+        """Drop state that has left the window; returns the number of entries removed"""
+        return 0
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'name': self.name,
+            'window_seconds': self.window,
+            'buckets': self.buckets,
+            'expired': self.expired,
+            'sweeper_running': self._sweeper_pid == os.getpid()
+        }
+
+    def _bucket(self, now):
+        return int(now // self.bucket_width)
+
+    def _ensure_sweeper(self):
+        """
+        Start the background sweeper on first use in this process
+        The pid check restarts it in worker processes forked after the limiter
+        was created (threads do not survive fork)
+        """
+        pid = os.getpid()
+        if self._sweeper_pid == pid or RATE_LIMIT_SWEEP_INTERVAL <= 0:
+            return
+        with _sweeper_lock:
+            if self._sweeper_pid == pid:
+                return
+            self._sweeper_pid = pid
+            threading.Thread(
+                target=self._sweep_loop,
+                name=f"rate-limit-sweeper-{self.name}",
+                daemon=True
+            ).start()
+
+    def _sweep_loop(self):
+        pid = os.getpid()
+        while self._sweeper_pid == pid:
+            time.sleep(RATE_LIMIT_SWEEP_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Rate limit sweep error ({self.name}): {str(e)}")
+
+
+class SlidingWindowLimiter(RateLimiter):
+    """
+    Bucketed sliding-window counter per key
+    The window is split into `buckets` slots; a key's count is the running total
+    of its slots that are still inside the window, so a check touches only that
+    key and costs the same with ten keys or a million.
+    Keys are kept in least-recently-hit order: at most `max_keys` are held (the
+    least recently hit is evicted to admit a new one) and the background
+    sweeper expires idle keys from the old end.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, window, buckets=RATE_LIMIT_BUCKETS, name='default', max_keys=RATE_LIMIT_MAX_KEYS):
+        super().__init__(name, window, buckets)
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, cost=1, now=None):
+        """Count a request for `key` unless that would exceed `limit`"""
+        now = time.time() if now is None else now
+        current = self._bucket(now)
+        oldest = current - self.buckets + 1
+        self._ensure_sweeper()
+        with self._lock:
+            window = self._keys.get(key)
+            if window is None:
+                while self._keys and len(self._keys) >= self.max_keys:
+                    self._keys.popitem(last=False)
+                    self.evictions += 1
+                window = self._keys[key] = _Window()
+            else:
+                self._keys.move_to_end(key)
+            window.advance(oldest)
+
+            if window.total + cost > limit:
+                return RateLimitResult(False, window.total, limit, self._reset_after(window, now))
+            window.add(current, cost)
+            return RateLimitResult(True, window.total, limit, self._reset_after(window, now))
+
+    def peek(self, key, limit, now=None):
+        """Current count for `key` without recording a request"""
+        now = time.time() if now is None else now
+        oldest = self._bucket(now) - self.buckets + 1
+        with self._lock:
+            window = self._keys.get(key)
+            if window is None:
+                return RateLimitResult(limit > 0, 0, limit, 0.0)
+            window.advance(oldest)
+            return RateLimitResult(window.total < limit, window.total, limit, self._reset_after(window, now))
+
+    def reset(self, key):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def sweep(self, now=None):
+        now = time.time() if now is None else now
+        oldest = self._bucket(now) - self.buckets + 1
+        removed = 0
+        done = False
+        while not done:
+            # Release the lock between chunks so checks are not held up by a long sweep
+            with self._lock:
+                for _ in range(SWEEP_CHUNK):
+                    if not self._keys:
+                        done = True
+                        break
+                    last = next(iter(self._keys.values())).last
+                    if last is not None and last >= oldest:
+                        done = True
+                        break
+                    self._keys.popitem(last=False)
+                    removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            size = len(self._keys)
+            sample = [item for item, _ in zip(self._keys.items(), range(100))]
+            table_bytes = sys.getsizeof(self._keys)
+        stats.update({
+            'keys': size,
+            'max_keys': self.max_keys,
+            'evictions': self.evictions,
+            'approx_bytes': table_bytes + self._approx_key_bytes(sample) * size
+        })
+        return stats
+
+    @staticmethod
+    def _approx_key_bytes(sample):
+        """Mean size of a key and its window, estimated from up to 100 entries"""
+        if not sample:
+            return 0
+        total = 0
+        for key, window in sample:
+            total += sys.getsizeof(key) + sys.getsizeof(window) + sys.getsizeof(window.buckets)
+            total += sum(sys.getsizeof(pair) + sys.getsizeof(pair[0]) for pair in window.buckets)
+        return total // len(sample)
+
+    def _reset_after(self, window, now):
+        """Seconds until the oldest counted bucket leaves the window"""
+        if not window.buckets:
+            return 0.0
+        return max(0.0, (window.buckets[0][0] + self.buckets) * self.bucket_width - now)
+
+
+class SharedMemoryLimiter(RateLimiter):
+    """
+    Sliding-window counters in a memory-mapped file shared by every worker on the host
+    The file is a fixed-size open-addressing table: each slot holds a key hash,
+    the newest bucket index it has advanced to, the running total and a ring of
+    bucket counts. Lookups probe at most SHM_PROBES slots; when none is free the
+    slot that has been idle longest is reused. Access is serialised with flock.
+    """
+
+    backend = 'shm'
+    MAGIC = b'VBRL'
+    HEADER = struct.Struct('<4sIIId')  # magic, layout version, buckets, slots, window
+    EVICTIONS = struct.Struct('<Q')  # shared eviction counter, stored after the header
+    EVICTIONS_OFFSET = 32
+    HEADER_SIZE = 64
+    SLOT_HEAD = struct.Struct('<QqI')  # key hash (0 = empty), newest bucket, total
+    SHM_PROBES = 16
+
+    def __init__(self, window, buckets=RATE_LIMIT_BUCKETS, name='default',
+                 directory=RATE_LIMIT_SHM_DIR, slots=RATE_LIMIT_SHM_SLOTS):
+        if fcntl is None:
+            raise RuntimeError('The shm rate limit backend needs fcntl (POSIX only)')
+        super().__init__(name, window, buckets)
+        self.slots = slots
+        self.path = os.path.join(directory, f"vulnbank-ratelimit-{name}.bin")
+        self._counts = struct.Struct(f'<{self.buckets}I')
+        self._slot_size = (self.SLOT_HEAD.size + self._counts.size + 7) // 8 * 8
+        self._size = self.HEADER_SIZE + self._slot_size * slots
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._map = mmap.mmap(self._fd, 0) if os.fstat(self._fd).st_size == self._size else None
+            header = self.HEADER.pack(self.MAGIC, 1, self.buckets, slots, float(window))
+            if self._map is None or self._map[:self.HEADER.size] != header:
+                # New file or a different layout: start from an empty table
+                if self._map is not None:
+                    self._map.close()
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                self._allocate()
+                self._map = mmap.mmap(self._fd, self._size)
+                self._map[:self.HEADER.size] = header
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _allocate(self):
+        """
+        Reserve the whole file now. ftruncate leaves it sparse, and touching a
+        page after tmpfs has filled up kills the worker with SIGBUS; failing
+        here reports the shortage at startup instead.
+        """
+        if not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(self._fd, 0, self._size)
+        except OSError as e:
+            raise OSError(e.errno, f"Cannot reserve {self._size} bytes for rate limit table {self.path} "
+                                   f"(is {os.path.dirname(self.path)} too small? lower RATE_LIMIT_SHM_*SLOTS "
+                                   f"or raise shm_size): {e.strerror}") from e
+
+    def hit(self, key, limit, cost=1, now=None):
+        now = time.time() if now is None else now
+        current = self._bucket(now)
+        with self._locked():
+            offset = self._find(self._hash(key), current, create=True)
+            total, counts = self._advance(offset, current)
+            allowed = total + cost <= limit
+            if allowed:
+                counts[current % self.buckets] += cost
+                total += cost
+                self._store(offset, current, total, counts)
+            return RateLimitResult(allowed, total, limit, self._reset_after(counts, current, now))
+
+    def peek(self, key, limit, now=None):
+        now = time.time() if now is None else now
+        current = self._bucket(now)
+        with self._locked():
+            offset = self._find(self._hash(key), current, create=False)
+            if offset is None:
+                return RateLimitResult(limit > 0, 0, limit, 0.0)
+            total, counts = self._advance(offset, current)
+            return RateLimitResult(total < limit, total, limit, self._reset_after(counts, current, now))
+
+    def reset(self, key):
+        with self._locked():
+            offset = self._find(self._hash(key), 0, create=False)
+            if offset is not None:
+                self._store(offset, 0, 0, [0] * self.buckets)
+
+    def _locked(self):
+        return _FileLock(self)
+
+    def _reopen(self):
+        """
+        Give a forked worker its own descriptor for the table file
+        flock locks belong to the open file description, which a preloaded app
+        shares with every worker, so without this workers would not exclude
+        each other. The shared mapping itself stays valid across fork.
+        """
+        inherited = self._fd
+        self._fd = os.open(self.path, os.O_RDWR)
+        self._pid = os.getpid()
+        os.close(inherited)
+
+    @staticmethod
+    def _hash(key):
+        # Stable across processes, unlike hash(); 0 marks an empty slot
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def _slot(self, index):
+        return self.HEADER_SIZE + index * self._slot_size
+
+    def _find(self, key_hash, current, create):
+        """Offset of the key's slot; with create, claim a free, expired or least recently used slot"""
+        start = key_hash % self.slots
+        candidate, candidate_newest = None, None
+        for probe in range(self.SHM_PROBES):
+            offset = self._slot((start + probe) % self.slots)
+            slot_hash, newest, _ = self.SLOT_HEAD.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset
+            if slot_hash == 0:
+                # Slots are never emptied, so the key cannot be further along
+                if candidate is None or candidate_newest >= current - self.buckets + 1:
+                    candidate, candidate_newest = offset, newest
+                break
+            if candidate is None or newest < candidate_newest:
+                candidate, candidate_newest = offset, newest
+        if not create:
+            return None
+        slot_hash = self.SLOT_HEAD.unpack_from(self._map, candidate)[0]
+        if slot_hash and candidate_newest >= current - self.buckets + 1:
+            # Probe run is full of live keys: the longest-idle one is evicted
+            evictions = self.EVICTIONS.unpack_from(self._map, self.EVICTIONS_OFFSET)[0]
+            self.EVICTIONS.pack_into(self._map, self.EVICTIONS_OFFSET, evictions + 1)
+        self.SLOT_HEAD.pack_into(self._map, candidate, key_hash, current, 0)
+        self._counts.pack_into(self._map, candidate + self.SLOT_HEAD.size, *([0] * self.buckets))
+        return candidate
+
+    def _advance(self, offset, current):
+        """Zero the ring buckets that left the window; returns (total, counts)"""
+        _, newest, total = self.SLOT_HEAD.unpack_from(self._map, offset)
+        counts = list(self._counts.unpack_from(self._map, offset + self.SLOT_HEAD.size))
+        if current - newest >= self.buckets:
+            counts = [0] * self.buckets
+            total = 0
+        else:
+            for index in range(newest + 1, current + 1):
+                total -= counts[index % self.buckets]
+                counts[index % self.buckets] = 0
+        if current > newest:
+            self._store(offset, current, total, counts)
+        return total, counts
+
+    def _store(self, offset, newest, total, counts):
+        slot_hash = self.SLOT_HEAD.unpack_from(self._map, offset)[0]
+        self.SLOT_HEAD.pack_into(self._map, offset, slot_hash, newest, total)
+        self._counts.pack_into(self._map, offset + self.SLOT_HEAD.size, *counts)
+
+    def _reset_after(self, counts, current, now):
+        for index in range(current - self.buckets + 1, current + 1):
+            if counts[index % self.buckets]:
+                return max(0.0, (index + self.buckets) * self.bucket_width - now)
+        return 0.0
+
+    def sweep(self, now=None):
+        # Expired slots are reclaimed in place by _find, nothing to sweep
+        return 0
+
+    def stats(self):
+        """Slot usage; scans the table, meant for monitoring rather than the request path"""
+        oldest = self._bucket(time.time()) - self.buckets + 1
+        used = live = 0
+        with self._locked():
+            for index in range(self.slots):
+                slot_hash, newest, total = self.SLOT_HEAD.unpack_from(self._map, self._slot(index))
+                if slot_hash:
+                    used += 1
+                    if total and newest >= oldest:
+                        live += 1
+            evictions = self.EVICTIONS.unpack_from(self._map, self.EVICTIONS_OFFSET)[0]
+        stats = super().stats()
+        stats.update({
+            'path': self.path,
+            'slots': self.slots,
+            'used_slots': used,
+            'live_keys': live,
+            'evictions': evictions,
+            'bytes': self._size
+        })
+        return stats
+
+
+class _FileLock:
+    """Exclusive lock on a SharedMemoryLimiter across threads (threading.Lock) and processes (flock)"""
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+
+    def __enter__(self):
+        limiter = self._limiter
+        limiter._thread_lock.acquire()
+        try:
+            if limiter._pid != os.getpid():
+                limiter._reopen()
+            fcntl.flock(limiter._fd, fcntl.LOCK_EX)
+        except Exception:
+            limiter._thread_lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._limiter._fd, fcntl.LOCK_UN)
+        finally:
+            self._limiter._thread_lock.release()
+
+
+class PostgresLimiter(RateLimiter):
+    """
+    Sliding-window counters in the rate_limit_counters table, shared by every replica
+    A check is one round trip: a per-key advisory lock, then a statement that
+    drops expired buckets, sums the rest and upserts the current bucket only if
+    the limit allows it. If the database is unreachable the request is allowed.
+    """
+
+    backend = 'postgres'
+
+    HIT_SQL = """
+        SELECT pg_advisory_xact_lock(hashtext(%(key)s));
+        WITH expired AS (
+            DELETE FROM rate_limit_counters WHERE key = %(key)s AND bucket < %(oldest)s
+        ), current_window AS (
+            SELECT COALESCE(SUM(count), 0) AS total, MIN(bucket) AS first_bucket
+            FROM rate_limit_counters
+            WHERE key = %(key)s AND bucket >= %(oldest)s
+        ), counted AS (
+            INSERT INTO rate_limit_counters (key, bucket, count, expires_at)
+            SELECT %(key)s, %(bucket)s, %(cost)s, %(expires_at)s
+            FROM current_window WHERE total + %(cost)s <= %(limit)s
+            ON CONFLICT (key, bucket) DO UPDATE SET count = rate_limit_counters.count + EXCLUDED.count
+            RETURNING count
+        )
+        SELECT total, EXISTS (SELECT 1 FROM counted), first_bucket FROM current_window
+    """
+
+    PEEK_SQL = """
+        SELECT COALESCE(SUM(count), 0), MIN(bucket)
+        FROM rate_limit_counters
+        WHERE key = %(key)s AND bucket >= %(oldest)s
+    """
+
+    def __init__(self, window, buckets=RATE_LIMIT_BUCKETS, name='default'):
+        super().__init__(name, window, buckets)
+        self.errors = 0
+
+    def hit(self, key, limit, cost=1, now=None):
+        self._ensure_sweeper()
+        now = time.time() if now is None else now
+        current = self._bucket(now)
+        params = {
+            'key': f"{self.name}:{key}",
+            'oldest': current - self.buckets + 1,
+            'bucket': current,
+            'cost': cost,
+            'limit': limit,
+            'expires_at': (current + self.buckets) * self.bucket_width
+        }
+        row = self._run(self.HIT_SQL, params)
+        if row is None:
+            return RateLimitResult(True, 0, limit, 0.0)
+        total, allowed, first_bucket = row
+        if allowed:
+            total += cost
+            first_bucket = current if first_bucket is None else first_bucket
+        return RateLimitResult(allowed, total, limit, self._reset_after(first_bucket, now))
+
+    def peek(self, key, limit, now=None):
+        now = time.time() if now is None else now
+        params = {'key': f"{self.name}:{key}", 'oldest': self._bucket(now) - self.buckets + 1}
+        row = self._run(self.PEEK_SQL, params)
+        if row is None:
+            return RateLimitResult(True, 0, limit, 0.0)
+        total, first_bucket = row
+        return RateLimitResult(total < limit, total, limit, self._reset_after(first_bucket, now))
+
+    def reset(self, key):
+        self._run("DELETE FROM rate_limit_counters WHERE key = %(key)s", {'key': f"{self.name}:{key}"}, fetch=False)
+
+    def _run(self, sql, params, fetch=True):
+        # Own connection and commit: counters must persist whatever the request does with its transaction
+        conn = None
+        try:
+            conn = database.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone() if fetch else None
+            conn.commit()
+            return row
+        except Exception as e:
+            self.errors += 1
+            print(f"Rate limit backend error ({self.name}): {str(e)}")
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            return None
+        finally:
+            if conn is not None:
+                database.return_connection(conn)
+
+    def _reset_after(self, first_bucket, now):
+        if first_bucket is None:
+            return 0.0
+        return max(0.0, (first_bucket + self.buckets) * self.bucket_width - now)
+
+    def _key_prefix(self):
+        """LIKE pattern matching this limiter's keys ('<name>:...')"""
+        return self.name.replace('%', r'\%').replace('_', r'\_') + ':%'
+
+    def sweep(self, now=None):
+        # Buckets of keys that are never hit again are only removed here; each
+        # limiter sweeps its own keys so `expired` counts only its rows
+        now = time.time() if now is None else now
+        row = self._run(
+            "WITH expired AS (DELETE FROM rate_limit_counters "
+            "WHERE key LIKE %(prefix)s AND expires_at <= %(now)s RETURNING 1) "
+            "SELECT COUNT(*) FROM expired",
+            {'prefix': self._key_prefix(), 'now': now}
+        )
+        removed = row[0] if row else 0
+        self.expired += removed
+        return removed
+
+    def stats(self):
+        stats = super().stats()
+        row = self._run(
+            "SELECT COUNT(*), COUNT(DISTINCT key) FROM rate_limit_counters WHERE key LIKE %(prefix)s",
+            {'prefix': self._key_prefix()}
+        )
+        stats.update({
+            'rows': row[0] if row else None,
+            'keys': row[1] if row else None,
+            'errors': self.errors
+        })
+        return stats
+
+
+BACKENDS = {
+    'memory': SlidingWindowLimiter,
+    'shm': SharedMemoryLimiter,
+    'postgres': PostgresLimiter
+}
+
+
+def create_limiter(name, window, buckets=RATE_LIMIT_BUCKETS, backend=None, shm_slots=None):
+    """
+    Build the configured backend (RATE_LIMIT_BACKEND) for one named limiter
+    shm_slots: table size for the shm backend (RATE_LIMIT_SHM_SLOTS by default)
+    """
+    backend = backend or RATE_LIMIT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == 'shm':
+        return SharedMemoryLimiter(window, buckets, name=name, slots=shm_slots or RATE_LIMIT_SHM_SLOTS)
+    return BACKENDS[backend](window, buckets, name=name)
+
+
+class RateLimitPolicy:
+    """
+    One row of the route rate limit table
+    routes: Flask URL rule pattern(s), fnmatch style ('/api/v*/reset-password')
+    key: callable returning the counter key for the current request, or None to skip
+    window / limit: requests allowed per sliding window of `window` seconds
+    burst: requests allowed in any one second (None for no burst limit)
+    methods: HTTP methods the policy applies to (None for all)
+    """
+
+    def __init__(self, name, routes, key, window, limit, burst=None, methods=None):
+        self.name = name
+        self.routes = (routes,) if isinstance(routes, str) else tuple(routes)
+        self.key = key
+        self.window = window
+        self.limit = limit
+        self.burst = burst
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.limiter = create_limiter(f"route-{name}", window, shm_slots=RATE_LIMIT_SHM_ROUTE_SLOTS)
+        self.burst_limiter = create_limiter(
+            f"route-{name}-burst", 1, BURST_BUCKETS, shm_slots=RATE_LIMIT_SHM_ROUTE_SLOTS
+        ) if burst else None
+
+    def matches(self, rule, method):
+        if self.methods is not None and method not in self.methods:
+            return False
+        return any(fnmatch.fnmatchcase(rule, pattern) for pattern in self.routes)
+
+    def check(self, key):
+        """
+        Count the request; returns (window_seconds, RateLimitResult) of the limit it broke, or None
+        The window limit is checked first: a request it denies is not counted
+        anywhere, so it uses up no burst capacity. A request the burst limit
+        denies still counts against the window.
+        """
+        window_result = self.limiter.hit(key, self.limit)
+        if not window_result.allowed:
+            return self.window, window_result
+        if self.burst_limiter is not None:
+            result = self.burst_limiter.hit(key, self.burst)
+            if not result.allowed:
+                return 1, result
+        note_rate_limit(window_result, self.window)
+        return None
+
+    def stats(self):
+        stats = {'routes': list(self.routes), 'window': self.limiter.stats()}
+        if self.burst_limiter is not None:
+            stats['burst'] = self.burst_limiter.stats()
+        return stats
+
+
+def note_rate_limit(result, window):
+    """
+    Remember a check's result for this request's RateLimit-* headers
+    When several limits apply, the one with the fewest requests remaining wins
+    """
+    current = g.get('_rate_limit')
+    if current is not None:
+        current_result = current[0]
+        remaining = result.limit - result.count
+        current_remaining = current_result.limit - current_result.count
+        if (remaining, -result.reset_after) >= (current_remaining, -current_result.reset_after):
+            return
+    g._rate_limit = (result, window)
+
+
+def add_rate_limit_headers(response):
+    """RateLimit-Limit / -Remaining / -Reset / -Policy (IETF draft), plus Retry-After on 429"""
+    noted = g.get('_rate_limit')
+    if noted is None:
+        return response
+    result, window = noted
+    reset = max(0, math.ceil(result.reset_after))
+    response.headers['RateLimit-Limit'] = str(result.limit)
+    response.headers['RateLimit-Remaining'] = str(max(0, result.limit - result.count))
+    response.headers['RateLimit-Reset'] = str(reset)
+    response.headers['RateLimit-Policy'] = f"{result.limit};w={int(window)}"
+    if response.status_code == 429 and 'Retry-After' not in response.headers:
+        response.headers['Retry-After'] = str(max(1, reset))
+    return response
+
+
+def rate_limited_response(policy, window, result):
+    """429 with Retry-After, same body shape as the AI endpoint limits"""
+    retry_after = max(1, math.ceil(result.reset_after))
+    response = jsonify({
+        'status': 'error',
+        'message': f'Rate limit exceeded. Try again in {retry_after} seconds.',
+        'rate_limit_info': {
+            'policy': policy.name,
+            'current_count': result.count,
+            'limit': result.limit,
+            'window_seconds': window,
+            'retry_after': retry_after
+        }
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_rate_limiting(app, policies):
+    """
+    Enforce a route policy table in a before_request hook
+    Runs after routing and before the view, so a limited request never checks
+    out a database connection. Matching policies are resolved once per URL rule.
+    Also installs the after_request hook that adds RateLimit-* headers for any
+    limit noted during the request (see note_rate_limit).
+    """
+    matching = {}
+
+    @app.before_request
+    def enforce_route_rate_limits():
+        rule = request.url_rule
+        if rule is None:
+            return None
+        cache_key = (rule.rule, request.method)
+        applicable = matching.get(cache_key)
+        if applicable is None:
+            applicable = matching[cache_key] = [
+                policy for policy in policies if policy.matches(rule.rule, request.method)
+            ]
+        for policy in applicable:
+            key = policy.key()
+            if key is None:
+                continue
+            broken = policy.check(key)
+            if broken is not None:
+                note_rate_limit(broken[1], broken[0])
+                return rate_limited_response(policy, *broken)
+        return None
+
+    app.after_request(add_rate_limit_headers)
+    return policies
@@ -0,0 +1,204 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+
+from database import execute_query
+
+# Revoked token ids live in revoked_tokens; each process mirrors them into a Bloom
+# filter so the common case (token not revoked) needs no database round trip
+REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', '100000'))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv('REVOCATION_BLOOM_ERROR_RATE', '0.001'))
+# Seconds between pulls of revocations made by other workers or replicas
+REVOCATION_REFRESH_INTERVAL = float(os.getenv('REVOCATION_REFRESH_INTERVAL', '5'))
+# Rows revoked this long before the newest one seen are pulled again, so a
+# revocation whose transaction committed late is not skipped
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class RevocationCheckError(Exception):
+    """A Bloom filter hit could not be confirmed in the database; the token's state is unknown"""
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings
+    Sized for `capacity` items at `error_rate` false positives; k bit positions
+    come from double hashing one SHA-256 digest
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """
+    Revoked jti lookups with a Bloom filter in front of the database
+    A filter miss means not revoked. A hit is confirmed with a primary-key
+    lookup; confirmed revocations are remembered so a replayed revoked token
+    only costs the database once. A background thread, started on first use in
+    each process, builds the filter, tops it up with newer rows every
+    REVOCATION_REFRESH_INTERVAL seconds and rebuilds it at twice the size once
+    it fills up; until the first load every check goes to the database.
+    """
+
+    def __init__(self, capacity=REVOCATION_BLOOM_CAPACITY, error_rate=REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = None
+        self._confirmed = set()
+        self._newest = None
+        self._refresher_pid = None
+        self._refresher_lock = threading.Lock()
+        self.checks = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+        self.errors = 0
+
+    def is_revoked(self, jti):
+        if not jti:
+            return False  # Tokens issued before jti was added cannot be revoked
+        self.checks += 1
+        self._ensure_refresher()
+        if jti in self._confirmed:
+            return True
+        bloom = self._filter
+        if bloom is not None and jti not in bloom:
+            return False
+
+        self.filter_hits += 1
+        try:
+            revoked = bool(execute_query(
+                "SELECT 1 FROM revoked_tokens WHERE jti = %s",
+                (jti,),
+                prepare=True,
+                primary=True,
+                category='interactive'
+            ))
+        except Exception as e:
+            # Could not confirm: neither let the token through nor report it as revoked
+            self.errors += 1
+            print(f"Revocation check failed: {str(e)}")
+            raise RevocationCheckError(str(e)) from e
+        if revoked:
+            self._confirmed.add(jti)
+        else:
+            self.false_positives += 1
+        return revoked
+
+    def revoke(self, jti, user_id=None):
+        execute_query(
+            "INSERT INTO revoked_tokens (jti, user_id) VALUES (%s, %s) ON CONFLICT (jti) DO NOTHING",
+            (jti, user_id),
+            fetch=False
+        )
+        self._confirmed.add(jti)
+        if self._filter is not None:
+            self._filter.add(jti)
+
+    def _ensure_refresher(self):
+        """
+        Start the background refresher on first use in this process
+        Checked by pid so each forked worker starts its own thread
+        """
+        pid = os.getpid()
+        if self._refresher_pid == pid:
+            return
+        with self._refresher_lock:
+            if self._refresher_pid == pid:
+                return
+            self._refresher_pid = pid
+            threading.Thread(target=self._refresh_loop, name='revocation-refresher', daemon=True).start()
+
+    def _refresh_loop(self):
+        pid = os.getpid()
+        while self._refresher_pid == pid:
+            try:
+                self._refresh()
+            except Exception as e:
+                self.errors += 1
+                print(f"Revocation list refresh failed: {str(e)}")
+            time.sleep(REVOCATION_REFRESH_INTERVAL)
+
+    def _refresh(self):
+        if self._filter is None or self._newest is None:
+            # First use, or nothing revoked yet: a full load is as cheap as a delta
+            self._rebuild()
+            return
+        rows = execute_query(
+            "SELECT jti, revoked_at FROM revoked_tokens WHERE revoked_at > %s",
+            (self._newest - REFRESH_OVERLAP,),
+            primary=True
+        )
+        for jti, revoked_at in rows:
+            # The overlap returns rows already loaded; re-adding would only inflate the count
+            if jti not in self._filter:
+                self._filter.add(jti)
+            self._newest = max(self._newest, revoked_at)
+        if self._filter.count > self._filter.capacity:
+            self._rebuild()
+
+    def _rebuild(self):
+        rows = execute_query("SELECT jti, revoked_at FROM revoked_tokens", primary=True)
+        capacity = self.capacity
+        while capacity < len(rows) * 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        newest = self._newest
+        for jti, revoked_at in rows:
+            bloom.add(jti)
+            newest = revoked_at if newest is None else max(newest, revoked_at)
+        self._filter = bloom
+        self._newest = newest
+        self.capacity = capacity
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            'loaded': bloom is not None,
+            'entries': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else self.capacity,
+            'filter_bytes': len(bloom._bits) if bloom else 0,
+            'hash_functions': bloom.hashes if bloom else None,
+            'checks': self.checks,
+            'filter_hits': self.filter_hits,
+            'false_positives': self.false_positives,
+            'confirmed_revoked': len(self._confirmed),
+            'errors': self.errors
+        }
+
+
+revocation_list = RevocationList()
+
+
+def is_token_revoked(jti):
+    return revocation_list.is_revoked(jti)
+
+
+def revoke_token(jti, user_id=None):
+    revocation_list.revoke(jti, user_id)
+
+
+def get_revocation_stats():
+    return revocation_list.stats()
@@ -768,8 +768,17 @@ async function loadPaymentHistory() {
     }
 }
 
-// Vulnerability: No server-side token invalidation
-function logout() {
+// Revoke the token server-side, then drop it locally
+async function logout() {
+    const token = localStorage.getItem('jwt_token');
+    try {
+        await fetch('/api/logout', {
+            method: 'POST',
+            headers: token ? { 'Authorization': `Bearer ${token}` } : {}
+        });
+    } catch (error) {
+        console.error('Error revoking token:', error);
+    }
     localStorage.removeItem('jwt_token');
     window.location.href = '/login';
 }
@@ -779,6 +788,8 @@ function logout() {
 
 let chatOpen = false;
 let chatHistory = [];
+// Latest RateLimit-* headers per chat mode, taken from AI responses (saves a status request)
+let aiRateLimits = {};
 
 // Initialize chat widget
 document.addEventListener('DOMContentLoaded', function() {
@@ -950,6 +961,7 @@ async function sendToAI(message) {
         });
         
         const data = await response.json();
+        recordRateLimitHeaders(selectedMode, response);
         
         // Hide typing indicator
         document.getElementById('typingIndicator').style.display = 'none';
@@ -981,6 +993,11 @@ async function sendToAI(message) {
                 rateLimitMessage += `You can check your rate limit status in the chat options.`;
             }
             
+            const retryAfter = response.headers.get('Retry-After');
+            if (retryAfter) {
+                rateLimitMessage += `\n\n⏳ Next request allowed in ${formatDuration(parseInt(retryAfter, 10))}.`;
+            }
+            
             setTimeout(() => {
                 addMessageToChat(rateLimitMessage, false);
             }, 500);
@@ -1055,8 +1072,44 @@ function escapeHtml(text) {
     return text.replace(/[&<>"']/g, function(m) { return map[m]; });
 }
 
+// Remember the RateLimit-* headers the AI endpoints return with every response
+function recordRateLimitHeaders(mode, response) {
+    const limit = response.headers.get('RateLimit-Limit');
+    const remaining = response.headers.get('RateLimit-Remaining');
+    if (limit === null || remaining === null) {
+        return;
+    }
+    const reset = parseInt(response.headers.get('RateLimit-Reset') || '0', 10);
+    aiRateLimits[mode] = {
+        limit: parseInt(limit, 10),
+        remaining: parseInt(remaining, 10),
+        resetsAt: Date.now() + reset * 1000
+    };
+}
+
+function formatDuration(seconds) {
+    if (seconds < 60) {
+        return `${seconds}s`;
+    }
+    const minutes = Math.ceil(seconds / 60);
+    return minutes < 60 ? `${minutes} min` : `${Math.floor(minutes / 60)}h ${minutes % 60}min`;
+}
+
 // Function to check current rate limit status
 async function checkRateLimitStatus() {
+    // Answer from the headers of the last AI response in this mode when we have them
+    const selectedMode = document.querySelector('input[name="chatMode"]:checked').value;
+    const known = aiRateLimits[selectedMode];
+    if (known && known.resetsAt > Date.now()) {
+        const resetIn = Math.ceil((known.resetsAt - Date.now()) / 1000);
+        let statusMessage = `📊 **Current Rate Limit Status**\n\n`;
+        statusMessage += `**${selectedMode === 'authenticated' ? 'Authenticated' : 'Anonymous'} Mode:**\n`;
+        statusMessage += `${known.limit - known.remaining}/${known.limit} requests used (${known.remaining} remaining)\n\n`;
+        statusMessage += `Oldest request leaves the window in ${formatDuration(resetIn)}.`;
+        addMessageToChat(statusMessage, false);
+        return;
+    }
+    
     try {
         const token = localStorage.getItem('jwt_token');
         const headers = {};
@@ -0,0 +1,42 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pagination import KeysetPage, decode_cursor, encode_cursor, keyset_condition
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 1, 1, 9, 30, 15)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+
+
+def test_keyset_condition_skips_null_timestamps():
+    assert keyset_condition('timestamp', 'id', None) == "AND timestamp IS NOT NULL"
+    condition = keyset_condition('ct.timestamp', 'ct.id', (datetime(2024, 1, 1), 7))
+    assert condition.startswith("AND ct.timestamp IS NOT NULL AND ")
+    assert "(ct.timestamp, ct.id) < ('2024-01-01T00:00:00'::timestamp, 7)" in condition
+
+
+def test_first_page_with_null_timestamp_row():
+    # NULLS FIRST mirrors PostgreSQL's DESC order, which puts the NULL row on the page boundary
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE transactions (id INTEGER, timestamp TEXT)")
+    db.executemany("INSERT INTO transactions VALUES (?, ?)", [
+        (1, '2024-01-01T10:00:00'),
+        (2, '2024-01-02T10:00:00'),
+        (3, None),
+    ])
+    limit = 1
+    rows = db.execute(f"""
+        SELECT id, timestamp FROM transactions
+        WHERE 1 = 1 {keyset_condition('timestamp', 'id', None)}
+        ORDER BY timestamp DESC NULLS FIRST, id DESC
+        LIMIT {limit + 1}
+    """).fetchall()
+
+    page = KeysetPage(rows, limit, lambda t: (datetime.fromisoformat(t[1]), t[0]))
+    assert [row[0] for row in page] == [2]
+    assert decode_cursor(page.next_cursor) == (datetime(2024, 1, 2, 10), 2)
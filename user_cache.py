@@ -0,0 +1,178 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database import execute_query
+
+# In-process cache of `users` rows keyed by id, filled on read
+# Each worker process has its own cache, so writes made by another process
+# become visible once the entry expires (USER_CACHE_TTL seconds)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+
+# Column positions in `SELECT * FROM users`
+USERNAME, ACCOUNT_NUMBER = 1, 3
+
+
+class UserCache:
+    """
+    Bounded LRU of users rows with a TTL and per-entry versions
+
+    A fill is a begin() / database read / put() sequence. Every invalidation
+    stamps the affected ids with a fresh version, and put() drops a row whose
+    begin() came before that stamp. A read that raced with a write therefore
+    cannot put the old row back after the write invalidated it.
+
+    Rows are also indexed by account number and username so writes that only
+    know those (transfers to an account, password resets) can invalidate.
+    """
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, version, row)
+        self._by_account = {}
+        self._by_username = {}
+        self._invalidated = {}  # user_id -> version of the last invalidation
+        self._floor = 0  # fills that began at or before this version are dropped
+        self._clock = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.rejected_fills = 0
+
+    def begin(self):
+        """Version token to take before reading the row from the database"""
+        with self._lock:
+            return next(self._clock)
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] <= now:
+                self._drop(user_id)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, user_id, row, version):
+        """Store a row read after begin() returned `version`; returns False if it is already stale"""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return False
+        row = tuple(row)
+        with self._lock:
+            if version <= self._floor or version < self._invalidated.get(user_id, 0):
+                self.rejected_fills += 1
+                return False
+            self._drop(user_id)
+            self._entries[user_id] = (time.monotonic() + self.ttl, version, row)
+            self._by_account[row[ACCOUNT_NUMBER]] = user_id
+            self._by_username[row[USERNAME]] = user_id
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, user_id=None, account_number=None, username=None):
+        """Drop the entry for a user identified by any of id, account number or username"""
+        with self._lock:
+            version = next(self._clock)
+            user_ids = set()
+            if user_id is not None:
+                user_ids.add(user_id)
+            for index, key in ((self._by_account, account_number), (self._by_username, username)):
+                if key is None:
+                    continue
+                indexed_id = index.get(key)
+                if indexed_id is None:
+                    # Not cached, but a fill for it may be in flight
+                    self._floor = version
+                else:
+                    user_ids.add(indexed_id)
+            for uid in user_ids:
+                self._invalidated[uid] = version
+                self._drop(uid)
+            self.invalidations += 1
+            if len(self._invalidated) > self.max_size:
+                # Forget per-user stamps, the floor keeps in-flight fills out
+                self._invalidated.clear()
+                self._floor = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_account.clear()
+            self._by_username.clear()
+            self._invalidated.clear()
+            self._floor = next(self._clock)
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        row = entry[2]
+        if self._by_account.get(row[ACCOUNT_NUMBER]) == user_id:
+            del self._by_account[row[ACCOUNT_NUMBER]]
+        if self._by_username.get(row[USERNAME]) == user_id:
+            del self._by_username[row[USERNAME]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'rejected_fills': self.rejected_fills
+            }
+
+
+user_cache = UserCache()
+
+
+def get_user(user_id):
+    """
+    Return the `SELECT * FROM users` row for user_id, or None
+    Misses read from the primary so a fill never caches a lagging replica row
+    """
+    row = user_cache.get(user_id)
+    if row is not None:
+        return row
+
+    version = user_cache.begin()
+    rows = execute_query(
+        "SELECT * FROM users WHERE id = %s",
+        (user_id,),
+        prepare=True,
+        primary=True,
+        category='interactive'
+    )
+    if not rows:
+        return None
+    user_cache.put(user_id, rows[0], version)
+    return tuple(rows[0])
+
+
+def invalidate_user(user_id=None, account_number=None, username=None):
+    user_cache.invalidate(user_id, account_number, username)
+
+
+def get_user_cache_stats():
+    return user_cache.stats()
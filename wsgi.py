@@ -0,0 +1,27 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported (and, with preload_app, fully built) once in the gunicorn
+master. Database connections must not be shared across fork, so each worker
+calls init_worker() from the post_fork hook to open its own pool. Servers
+without a post-fork hook should call init_worker() once per process.
+"""
+from app import app
+from database import start_background_init, close_connection_pool
+
+
+def init_worker():
+    """
+    Start opening this process's connection pool and migrating the schema
+    Runs in the background so the worker serves /healthz straight away; other
+    requests get a 503 until /readyz reports ready. The migration advisory
+    lock lets the first worker apply pending migrations while the rest wait.
+    """
+    start_background_init()
+
+
+def shutdown_worker():
+    """Close this process's pooled connections"""
+    close_connection_pool()